@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Cosine similarity above which two contextualized queries count as the same question
+ANSWER_SIMILARITY = 0.92
+
+class AnswerCache:
+    """Semantic cache of generated answers, keyed by the embedding of the (contextualized) query.
+
+    A lookup hits when a cached query is at least threshold-similar and was answered from the same
+    retrieved chunks with the same model. All entries are dropped when the collection version changes,
+    and the least recently used ones are evicted beyond max_entries. Similarities are computed against
+    all cached embeddings with one matrix-vector product.
+    """
+
+    def __init__(self, max_entries: int = 1024, threshold: float = ANSWER_SIMILARITY):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._vectors = None  # one row per slot, unit length
+        self._entries = OrderedDict()  # slot -> (chunk_ids, model, answer, sources)
+        self._free = list(range(max_entries))
+        self._lock = threading.Lock()
+
+    def get(self, embedding, chunk_ids, model: str, version):
+        """Return the cached (answer, sources) for a similar query over the same chunks, or None on a miss"""
+        query = self._normalize(embedding)
+        with self._lock:
+            self._check_version(version)
+            if not self._entries:
+                self.misses += 1
+                return None
+            slots = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+            similarity = self._vectors[slots] @ query
+            for i in np.argsort(-similarity, kind="stable"):
+                if similarity[i] < self.threshold:
+                    break
+                slot = int(slots[i])
+                cached_ids, cached_model, answer, sources = self._entries[slot]
+                if cached_ids == tuple(chunk_ids) and cached_model == model:
+                    self._entries.move_to_end(slot)
+                    self.hits += 1
+                    return answer, sources
+            self.misses += 1
+            return None
+
+    def put(self, embedding, chunk_ids, model: str, version, answer: str, sources):
+        """Cache an answer, evicting the least recently used one when full"""
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(version)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            if not self._free:
+                slot, _ = self._entries.popitem(last=False)
+                self._free.append(slot)
+                self.evictions += 1
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._entries[slot] = (tuple(chunk_ids), model, answer, list(sources))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._free = list(range(self.max_entries))
+
+    def stats(self):
+        """Return hit/miss counters and current occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+        }
+
+    def _check_version(self, version):
+        # Re-indexed documents may change the answers, so start over
+        if version != self.version:
+            self._entries.clear()
+            self._free = list(range(self.max_entries))
+            self.version = version
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,305 @@
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+from doc_processor import chunk_spans
+
+WORDS = ("employee remote office policy hybrid work manager approval leave request "
+         "schedule equipment security laptop travel expense benefit insurance").split()
+
+def synthetic_text(size_bytes: int, seed: int = 0):
+    """Generate policy-like prose of roughly the given size"""
+    rng = random.Random(seed)
+    sentences = []
+    total = 0
+    while total < size_bytes:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 30))).capitalize() + "."
+        sentences.append(sentence)
+        total += len(sentence) + 1
+        if rng.random() < 0.1:
+            sentences.append("\n")
+    return " ".join(sentences)
+
+def legacy_split_text(text: str, chunk_size: int = 500,overlap_size: int = 50):
+    """The original list-based split_text, kept as a baseline for comparison"""
+    sentences = text.replace('\n', ' ').split('. ')
+    chunks = []
+    current_chunk = []
+    current_size = 0
+
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+
+        if not sentence.endswith('.'):
+            sentence += '.'
+
+        sentence_size = len(sentence)
+
+        if current_size + sentence_size > chunk_size and current_chunk:
+            chunks.append(' '.join(current_chunk))
+            overlap = []
+            total = 0
+
+            for sentence in reversed(current_chunk):
+                total += len(sentence)
+                overlap.insert(0, sentence)
+                if total >= overlap_size:
+                    break
+            current_chunk = overlap + [sentence]
+            current_size = sum(len(s) for s in current_chunk)
+
+        else:
+            current_chunk.append(sentence)
+            current_size += sentence_size
+
+    if current_chunk:
+        chunks.append(' '.join(current_chunk))
+
+    return chunks
+
+def _best_of(fn, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def bench_chunker(sizes_mb=(1, 4, 16), repeat: int = 3):
+    """Compare the legacy split_text with the span-based chunker on multi-MB text"""
+    print(f"{'size':>6} {'method':<16} {'seconds':>8} {'MB/s':>8} {'chunks':>8}")
+    for size_mb in sizes_mb:
+        text = synthetic_text(int(size_mb * 1024 * 1024))
+        runs = [
+            ("legacy", lambda: legacy_split_text(text)),
+            ("spans chars", lambda: chunk_spans(text)),
+            ("spans tokens", lambda: chunk_spans(text, 100, 10, unit="tokens")),
+        ]
+        for name, fn in runs:
+            seconds, chunks = _best_of(fn, repeat)
+            print(f"{size_mb:>4}MB {name:<16} {seconds:>8.3f} {size_mb / seconds:>8.1f} {len(chunks):>8}")
+
+DISCLAIMER = ("This policy is the property of the company and is provided for internal use only. "
+              "It must not be copied, distributed or disclosed to third parties without written approval. "
+              "Printed copies are uncontrolled; always refer to the latest version on the policy portal. "
+              "Questions about this policy should be directed to your manager or to Human Resources. ")
+
+def bench_dedup(pages: int = 300, page_bytes: int = 2500, embed: bool = True):
+    """Measure index shrinkage and ingest time saved by near-duplicate elimination on boilerplate-heavy pages"""
+    from chroma_utils import DEDUP_THRESHOLD, get_engine
+    from dedup import ChunkDeduplicator
+
+    # Every page repeats the same disclaimer, as headers and footers do in the policy PDFs
+    text = "".join(DISCLAIMER * 2 + synthetic_text(page_bytes, seed=page) + "\n" for page in range(pages))
+    chunks = [text[start:end] for start, end in chunk_spans(text)]
+    ids = [f"bench_chunk_{i}" for i in range(len(chunks))]
+    metadatas = [{"source": "bench", "chunk": i} for i in range(len(chunks))]
+
+    start = time.perf_counter()
+    dedup = ChunkDeduplicator(DEDUP_THRESHOLD)
+    _, kept, _ = dedup.filter(ids, chunks, metadatas)
+    dedup_seconds = time.perf_counter() - start
+    stats = dedup.stats()
+    print(f"chunks {stats['chunks']} -> {stats['kept']} ({stats['reduction']:.1%} smaller), "
+          f"dedup took {dedup_seconds:.3f}s")
+
+    if embed:
+        # Time the uncached model so the comparison is not skewed by the embedding cache
+        encode = get_engine().embedding_function.embedding_function
+        start = time.perf_counter()
+        encode(chunks)
+        full_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        encode(kept)
+        kept_seconds = time.perf_counter() - start + dedup_seconds
+        print(f"embedding: all chunks {full_seconds:.2f}s, deduplicated {kept_seconds:.2f}s "
+              f"(including dedup), {full_seconds / kept_seconds:.2f}x faster")
+
+def _percentile(values, fraction: float):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def sample_queries(collection, count: int, seed: int = 0):
+    """Sample (query, relevant chunk ids) pairs, using a sentence of a stored chunk as the query"""
+    rng = random.Random(seed)
+    total = collection.count()
+    queries = []
+    while len(queries) < count and total:
+        page = collection.get(include=["documents"], limit=1, offset=rng.randrange(total))
+        sentences = [s.strip() for s in page["documents"][0].split(". ") if len(s.split()) >= 5]
+        if not sentences:
+            continue
+        sentence = rng.choice(sentences)
+        # Chunk overlap means several chunks can contain the same sentence
+        relevant = set(collection.get(where_document={"$contains": sentence}, include=[])["ids"])
+        queries.append((sentence, relevant))
+    return queries
+
+def bench_retrieval(queries: int = 200, k: int = 3):
+    """Compare recall@k and latency of hybrid RRF retrieval against vector search with keyword overlap"""
+    from chroma_utils import get_collection, semantic_search
+
+    collection = get_collection()
+    sample = sample_queries(collection, queries)
+    print(f"{'method':<10} {'recall@' + str(k):>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for method in ("overlap", "rrf"):
+        hits = 0
+        latencies = []
+        for query, relevant in sample:
+            start = time.perf_counter()
+            results = semantic_search(collection, query, k, method=method)
+            latencies.append((time.perf_counter() - start) * 1000)
+            retrieved = {f"{meta['source']}_chunk_{meta['chunk']}" for _, _, meta in results}
+            hits += bool(retrieved & relevant)
+        print(f"{method:<10} {hits / len(sample):>9.3f} {_percentile(latencies, 0.5):>8.1f} "
+              f"{_percentile(latencies, 0.95):>8.1f}")
+
+def bench_quantized(queries: int = 200, k: int = 10, candidates: int = 100):
+    """Compare the int8 quantized index with plain Chroma queries on recall, latency and memory"""
+    import os
+    from chroma_utils import get_engine
+    from quantized_index import QuantizedIndex
+
+    engine = get_engine()
+    collection = engine.collection
+    start = time.perf_counter()
+    index = QuantizedIndex.build(collection, engine.quantized_index_path)
+    print(f"built index over {len(index)} vectors in {time.perf_counter() - start:.2f}s")
+
+    texts = [query for query, _ in sample_queries(collection, queries)]
+    embeddings = engine.embed_queries(texts)
+    overlap = 0
+    chroma_ms, quantized_ms = [], []
+    for embedding in embeddings:
+        start = time.perf_counter()
+        exact = collection.query(query_embeddings=[embedding], n_results=k, include=[])["ids"][0]
+        chroma_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        approx = index.search([embedding], k, candidates)[0][0]
+        quantized_ms.append((time.perf_counter() - start) * 1000)
+        overlap += len(set(exact) & set(approx))
+
+    float_bytes = index.vectors.size * 4
+    first_pass_bytes = index.codes.size + index.scales.nbytes + index.norms.nbytes
+    print(f"recall@{k} vs Chroma: {overlap / (k * len(embeddings)):.3f} (candidates={candidates})")
+    print(f"latency p50/p95 ms: chroma {_percentile(chroma_ms, 0.5):.2f}/{_percentile(chroma_ms, 0.95):.2f}, "
+          f"quantized {_percentile(quantized_ms, 0.5):.2f}/{_percentile(quantized_ms, 0.95):.2f}")
+    print(f"memory scanned per query: float32 {float_bytes / 2**20:.1f} MiB, "
+          f"int8 first pass {first_pass_bytes / 2**20:.1f} MiB "
+          f"({os.path.getsize(index.path + '.int8') / 2**20:.1f} MiB on disk)")
+
+def loop_mmr_select(query_embedding, candidate_embeddings, k: int, lambda_mult: float = 0.5):
+    """Reference MMR with per-pair cosine similarity in Python loops"""
+    def cosine(a, b):
+        dot = sum(x * y for x, y in zip(a, b))
+        return dot / ((sum(x * x for x in a) ** 0.5) * (sum(y * y for y in b) ** 0.5))
+
+    remaining = list(range(len(candidate_embeddings)))
+    selected = []
+    while remaining and len(selected) < k:
+        def score(i):
+            redundancy = max((cosine(candidate_embeddings[i], candidate_embeddings[j]) for j in selected), default=0.0)
+            return lambda_mult * cosine(query_embedding, candidate_embeddings[i]) - (1 - lambda_mult) * redundancy
+        best = max(remaining, key=score)
+        selected.append(best)
+        remaining.remove(best)
+    return selected
+
+def bench_mmr(pool_sizes=(50, 100, 200, 500), k: int = 10, lambda_mult: float = 0.5, dim: int = 384,
+              repeat: int = 5):
+    """Time NumPy MMR selection against a Python-loop version for growing candidate pools"""
+    import numpy as np
+    from mmr import mmr_select
+
+    rng = np.random.default_rng(0)
+    print(f"{'pool':>6} {'method':<8} {'ms':>10} {'same picks':>11}")
+    for pool in pool_sizes:
+        query = rng.standard_normal(dim).astype(np.float32)
+        candidates = rng.standard_normal((pool, dim)).astype(np.float32)
+        numpy_s, picks = _best_of(lambda: mmr_select(query, candidates, k, lambda_mult), repeat)
+        print(f"{pool:>6} {'numpy':<8} {numpy_s * 1000:>10.2f} {'':>11}")
+        query_list, candidate_lists = query.tolist(), candidates.tolist()
+        loop_s, loop_picks = _best_of(lambda: loop_mmr_select(query_list, candidate_lists, k, lambda_mult), 1)
+        print(f"{pool:>6} {'loop':<8} {loop_s * 1000:>10.2f} {str(picks == loop_picks):>11}")
+
+STARTUP_PROBE = """
+import json, time
+start = time.perf_counter()
+import chroma_utils
+imported = time.perf_counter()
+engine = chroma_utils.get_engine()
+if {warm_up}:
+    engine.warm_up(background=False)
+ready = time.perf_counter()
+chroma_utils.semantic_search(engine.collection, {query!r}, 3)
+done = time.perf_counter()
+print(json.dumps({{"import": imported - start, "init": ready - imported,
+                  "first_query": done - ready, "total": done - start}}))
+"""
+
+def bench_startup(query: str = "What is the hybrid work policy?", repeat: int = 3):
+    """Measure import-to-first-query latency in fresh interpreters, with and without an explicit warm-up"""
+    print(f"{'mode':<10} {'import':>8} {'init':>8} {'query':>8} {'total':>8}")
+    for warm_up in (False, True):
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", STARTUP_PROBE.format(warm_up=warm_up, query=query)],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            timings = json.loads(output.strip().splitlines()[-1])
+            print(f"{'warm-up' if warm_up else 'lazy':<10} {timings['import']:>8.3f} {timings['init']:>8.3f} "
+                  f"{timings['first_query']:>8.3f} {timings['total']:>8.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Performance benchmarks for the week1 RAG chatbot")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    chunker = subparsers.add_parser("chunker", help="split_text vs the span-based chunker")
+    chunker.add_argument("--sizes", type=float, nargs="+", default=[1, 4, 16], help="text sizes in MB")
+    chunker.add_argument("--repeat", type=int, default=3)
+
+    startup = subparsers.add_parser("startup", help="import-to-first-query latency")
+    startup.add_argument("--query", default="What is the hybrid work policy?")
+    startup.add_argument("--repeat", type=int, default=3)
+
+    dedup = subparsers.add_parser("dedup", help="index size and ingest time with near-duplicate elimination")
+    dedup.add_argument("--pages", type=int, default=300)
+    dedup.add_argument("--no-embed", action="store_true", help="skip timing the embedding model")
+
+    retrieval = subparsers.add_parser("retrieval", help="recall and latency of hybrid vs overlap re-ranking")
+    retrieval.add_argument("--queries", type=int, default=200)
+    retrieval.add_argument("-k", type=int, default=3)
+
+    quantized = subparsers.add_parser("quantized", help="int8 quantized index vs plain Chroma queries")
+    quantized.add_argument("--queries", type=int, default=200)
+    quantized.add_argument("-k", type=int, default=10)
+    quantized.add_argument("--candidates", type=int, default=100)
+
+    mmr = subparsers.add_parser("mmr", help="NumPy vs Python-loop maximal marginal relevance selection")
+    mmr.add_argument("--pools", type=int, nargs="+", default=[50, 100, 200, 500])
+    mmr.add_argument("-k", type=int, default=10)
+    mmr.add_argument("--lambda", dest="lambda_mult", type=float, default=0.5)
+    mmr.add_argument("--repeat", type=int, default=5)
+
+    args = parser.parse_args()
+    if args.benchmark == "chunker":
+        bench_chunker(args.sizes, args.repeat)
+    elif args.benchmark == "startup":
+        bench_startup(args.query, args.repeat)
+    elif args.benchmark == "dedup":
+        bench_dedup(args.pages, embed=not args.no_embed)
+    elif args.benchmark == "retrieval":
+        bench_retrieval(args.queries, args.k)
+    elif args.benchmark == "quantized":
+        bench_quantized(args.queries, args.k, args.candidates)
+    elif args.benchmark == "mmr":
+        bench_mmr(args.pools, args.k, args.lambda_mult, repeat=args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+# Stored next to chroma_db and kept in step with it at ingest time
+BM25_INDEX_PATH = "bm25_index.json"
+BM25_INDEX_VERSION = 1
+
+def tokenize(text: str):
+    return re.findall(r"\w+", text.lower())
+
+class BM25Index:
+    """Persisted BM25 inverted index over chunk texts, keyed by chunk id"""
+
+    def __init__(self, path: str = BM25_INDEX_PATH, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.postings = {}      # term -> {chunk_id: term frequency}
+        self.doc_lengths = {}   # chunk_id -> number of tokens
+        self.total_length = 0
+        self.dirty = False
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, ids, texts):
+        """Index chunks, replacing any previous text stored under the same ids"""
+        with self._lock:
+            self.remove(ids)
+            for chunk_id, text in zip(ids, texts):
+                counts = Counter(tokenize(text))
+                for term, tf in counts.items():
+                    self.postings.setdefault(term, {})[chunk_id] = tf
+                length = sum(counts.values())
+                self.doc_lengths[chunk_id] = length
+                self.total_length += length
+            self.dirty = True
+
+    def remove(self, ids):
+        """Drop chunks from the index"""
+        with self._lock:
+            removed = {chunk_id for chunk_id in ids if chunk_id in self.doc_lengths}
+            if not removed:
+                return
+            for term in list(self.postings):
+                docs = self.postings[term]
+                for chunk_id in removed.intersection(docs):
+                    del docs[chunk_id]
+                if not docs:
+                    del self.postings[term]
+            for chunk_id in removed:
+                self.total_length -= self.doc_lengths.pop(chunk_id)
+            self.dirty = True
+
+    def search(self, query: str, k: int = 10, allowed_ids=None):
+        """Return the top k (chunk_id, score) pairs for a query, optionally restricted to allowed_ids"""
+        with self._lock:
+            n_docs = len(self.doc_lengths)
+            if not n_docs:
+                return []
+            avg_length = self.total_length / n_docs
+            scores = Counter()
+            for term in set(tokenize(query)):
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for chunk_id, tf in docs.items():
+                    if allowed_ids is not None and chunk_id not in allowed_ids:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[chunk_id] / avg_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self):
+        """Atomically write the index if it changed"""
+        with self._lock:
+            if not self.dirty:
+                return
+            data = {
+                "version": BM25_INDEX_VERSION,
+                "postings": self.postings,
+                "doc_lengths": self.doc_lengths,
+            }
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(data, file, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path: str = BM25_INDEX_PATH):
+        """Load a persisted index, or return an empty one if it is missing or outdated"""
+        index = cls(path)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return index
+        if data.get("version") != BM25_INDEX_VERSION:
+            return index
+        index.postings = data["postings"]
+        index.doc_lengths = data["doc_lengths"]
+        index.total_length = sum(index.doc_lengths.values())
+        return index
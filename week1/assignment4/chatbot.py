@@ -1,21 +1,24 @@
-import requests
-from chroma_utils import semantic_search,get_context_with_sources
+import time
+from concurrent.futures import ThreadPoolExecutor
+from answer_cache import AnswerCache
+from bm25_index import tokenize
+from chroma_utils import get_engine,semantic_search,get_context_with_sources
+from reranker import RERANK_POOL_FACTOR
 from session import contextualize_query,format_history_for_prompt,add_message
-from openai import AzureOpenAI
+from llm_gateway import OLLAMA_MODEL,get_gateway
 
  
-OLLAMA_URL = "http://localhost:11434/api/generate"
-MODEL_NAME = "deepseek-r1:7b"
+MODEL_NAME = OLLAMA_MODEL
+# Token overlap (Jaccard) above which a rewritten query reuses the raw query's results
+SPECULATION_SIMILARITY = 0.8
+ERROR_RESPONSE = "I encountered an error while generating the response."
 
-def call_gpt(prompt: str) -> str:
-    client = AzureOpenAI(
-        api_version="2024-12-01-preview",
-        azure_endpoint="https://azure-openai-101.openai.azure.com/",
-        api_key="api key",
-    )
+answer_cache = AnswerCache()
+# Runs the speculative retrieval next to the rewrite; a thread, so callers need no event loop
+_speculation_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="speculative-retrieval")
 
-    response = client.chat.completions.create(
-        model="gpt-4.1",
+def call_gpt(prompt: str) -> str:
+    response = get_gateway().azure_chat(
         messages=[
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": prompt},
@@ -23,19 +26,22 @@ def call_gpt(prompt: str) -> str:
         temperature=0.2,
     )
 
-    return response.choices[0].message.content.strip()
+    return response.strip()
 
 def call_llama(prompt: str) -> str:
-    response = requests.post(
-        OLLAMA_URL,
-        json={
-            "model": MODEL_NAME,
-            "prompt": prompt,
-            "stream": False
-        }
+    return get_gateway().ollama_generate(prompt, model=MODEL_NAME)
+
+def stream_gpt(prompt: str):
+    return get_gateway().azure_chat_stream(
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.2,
     )
-    response.raise_for_status()
-    return response.json()["response"]
+
+def stream_llama(prompt: str):
+    return get_gateway().ollama_generate_stream(prompt, model=MODEL_NAME)
  
 def get_prompt(context, conversation_history, query):
   prompt = f"""Based on the following context and conversation history, please provide a relevant and contextual response.
@@ -54,10 +60,15 @@ def get_prompt(context, conversation_history, query):
  
  
 # Updated generate response function with conversation history also passed for Chatbot Memory
-def generate_response(query: str, context: str, conversation_history: str = "",model:str=""):
-    """Generate a response using Ollama (DeepSeek-R1) with conversation history"""
+def generate_response(query: str, context: str, conversation_history: str = "",model:str="", stream: bool = False):
+    """Generate a response using Ollama (DeepSeek-R1) with conversation history.
+
+    With stream=True, return a generator that yields the response tokens as they arrive.
+    """
 
     prompt = get_prompt(context, conversation_history, query)
+    if stream:
+        return stream_response(prompt, model)
 
     try:
         if model == "gpt":
@@ -69,32 +80,81 @@ def generate_response(query: str, context: str, conversation_history: str = "",m
 
     except Exception as e:
         print(f"Error generating response: {e}")
-        return "I encountered an error while generating the response."
+        return ERROR_RESPONSE
+
+def stream_response(prompt: str, model: str = ""):
+    """Yield response tokens from the selected model as they arrive"""
+    try:
+        yield from stream_gpt(prompt) if model == "gpt" else stream_llama(prompt)
+    except Exception as e:
+        print(f"Error generating response: {e}")
+        yield ERROR_RESPONSE
+
 def conversational_rag_query(
     collection,
     query: str,
     session_id: str,
     n_chunks: int = 3,
-    model:str=''
+    model:str='',
+    where: dict = None,
+    mmr_lambda: float = None,
+    reranker=None,
+    stream: bool = False,
+    timings: dict = None
 ):
-    """Perform RAG query with conversation history"""
+    """Perform RAG query with conversation history, optionally filtered by chunk metadata.
+
+    reranker is any object with rerank(query, results, top_k), e.g. reranker.get_reranker().
+    With stream=True the response is a token generator, and the turn is added to the history once it ends.
+    Stage durations in seconds are written to timings, if given.
+    """
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
     # Get conversation history
-    conversation_history = format_history_for_prompt(session_id)
+    conversation_history = format_history_for_prompt(session_id, model=model)
 
     # Handle follo up questions
     print('model_type:',model)
-    query = contextualize_query(query, conversation_history,model)
-    # print("Contextualized Query:", query)
 
-    # Get relevant chunks
-    context, sources = get_context_with_sources(
-        semantic_search(collection, query, n_chunks)
-    )
+    def retrieve(search_query):
+        # Get relevant chunks
+        if reranker is None:
+            return semantic_search(collection, search_query, n_chunks, where=where, mmr_lambda=mmr_lambda)
+        results = semantic_search(collection, search_query, n_chunks * RERANK_POOL_FACTOR, where=where, mmr_lambda=mmr_lambda)
+        return reranker.rerank(search_query, results, n_chunks)
+
+    query, results = _contextualize_and_retrieve(query, conversation_history, model, retrieve, timings)
+    # print("Contextualized Query:", query)
+    context, sources = get_context_with_sources(results)
     # print("Context:", context)
     # print("Sources:", sources)
-
-
-    response = generate_response(query, context, conversation_history,model)
+    timings["prepare"] = time.perf_counter() - start
+
+    # Reuse the answer to an earlier, similar question over the same chunks
+    engine = get_engine()
+    version = engine.version
+    chunk_ids = [f"{meta['source']}_chunk_{meta['chunk']}" for _, _, meta in results]
+    embedding = engine.embed_queries([query])[0]
+    cached = answer_cache.get(embedding, chunk_ids, model, version)
+    timings["answer_cache_hit"] = cached is not None
+
+    def remember(answer):
+        if answer and ERROR_RESPONSE not in answer:
+            answer_cache.put(embedding, chunk_ids, model, version, answer, sources)
+
+    if stream:
+        if cached is not None:
+            return _record_stream(session_id, query, iter([cached[0]]), timings), sources
+        tokens = generate_response(query, context, conversation_history, model, stream=True)
+        return _record_stream(session_id, query, tokens, timings, on_complete=remember), sources
+
+    generate_start = time.perf_counter()
+    if cached is not None:
+        response = cached[0]
+    else:
+        response = generate_response(query, context, conversation_history,model)
+        remember(response)
+    timings["generate"] = time.perf_counter() - generate_start
 
     # Add to conversation history
     add_message(session_id, "user", query)
@@ -102,3 +162,54 @@ def conversational_rag_query(
 
     return response, sources
  
+
+def _contextualize_and_retrieve(query: str, conversation_history: str, model: str, retrieve, timings: dict):
+    """Retrieve for the raw query while it is being rewritten, and keep those results if the rewrite is close"""
+    def timed(stage, fn, *args):
+        stage_start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings[stage] = time.perf_counter() - stage_start
+
+    start = time.perf_counter()
+    speculative = _speculation_executor.submit(timed, "retrieve_speculative", retrieve, query)
+    rewritten = timed("contextualize", contextualize_query, query, conversation_history, model)
+    try:
+        results = speculative.result()
+    except Exception as e:
+        print(f"Error in speculative retrieval: {e}")
+        results = None
+    timings["speculation_hit"] = results is not None and query_similarity(query, rewritten) >= SPECULATION_SIMILARITY
+    if not timings["speculation_hit"]:
+        results = timed("retrieve", retrieve, rewritten)
+    # Time saved by running the two stages side by side
+    timings["overlap"] = timings["contextualize"] + timings["retrieve_speculative"] + timings.get("retrieve", 0.0) \
+        - (time.perf_counter() - start)
+    return rewritten, results
+
+def query_similarity(a: str, b: str):
+    """Jaccard overlap of the word tokens of two queries"""
+    a, b = set(tokenize(a)), set(tokenize(b))
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+def _record_stream(session_id: str, query: str, tokens, timings: dict = None, on_complete=None):
+    """Pass tokens through, then add the turn to the history once the stream ends.
+
+    on_complete is called with the full answer only if the stream was read to the end.
+    """
+    received = []
+    start = time.perf_counter()
+    try:
+        for token in tokens:
+            if not received and timings is not None:
+                timings["first_token"] = time.perf_counter() - start
+            received.append(token)
+            yield token
+        if on_complete is not None:
+            on_complete("".join(received).strip())
+    finally:
+        if timings is not None:
+            timings["generate"] = time.perf_counter() - start
+        add_message(session_id, "user", query)
+        add_message(session_id, "assistant", "".join(received).strip())
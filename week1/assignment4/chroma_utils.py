@@ -1,64 +1,582 @@
-import chromadb
+import hashlib
+import json
+import multiprocessing
 import os
-from chromadb.utils import embedding_functions
-from doc_processor import read_document,split_text
-
-# Initialize ChromaDB client with persistence
-client = chromadb.PersistentClient(path="chroma_db")
-
-# Configure sentence transformer embeddings
-sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="all-MiniLM-L6-v2"
-)
-
-# Create or get existing collection
-collection = client.get_or_create_collection(
-    name="documents_collection",
-    embedding_function=sentence_transformer_ef
-)
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor,ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+from bm25_index import BM25_INDEX_PATH,BM25Index
+from dedup import ChunkDeduplicator
+from lexical_store import LEXICAL_STORE_PATH,LexicalStore
+from doc_processor import SUPPORTED_EXTENSIONS,chunk_document,count_tokens,iter_chunks,iter_document
+from manifest import MANIFEST_PATH,file_hash,load_manifest,manifest_fingerprint,save_manifest
+from mmr import mmr_select
+from quantized_index import QUANTIZED_INDEX_PATH,QuantizedIndex
+from query_cache import QueryCache,normalize_query
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBED_BATCH_SIZE = 512
+# Estimated Jaccard similarity above which a chunk is dropped as a near-duplicate
+DEDUP_THRESHOLD = 0.8
+# Candidates fetched from each retriever before fusion, and the reciprocal rank fusion constant
+RETRIEVAL_CANDIDATES = 50
+RRF_K = 60
+# Queries embedded and sent to Chroma together by semantic_search_many
+QUERY_BATCH_SIZE = 256
+# Serve vector search from the int8 quantized index instead of Chroma's HNSW index
+USE_QUANTIZED_INDEX = False
+# Candidate pool fetched per result when diversifying with maximal marginal relevance
+MMR_POOL_FACTOR = 4
+# Token budget for the context passed to the LLM (None for no limit)
+CONTEXT_TOKEN_BUDGET = 2000
+# Also keep one sub-collection per source, so queries scoped to one document only search its shard
+SHARD_BY_SOURCE = False
+CHROMA_PATH = "chroma_db"
+COLLECTION_NAME = "documents_collection"
+
+class RagEngine:
+    """Chroma client, embedding function and collection, each created on first use.
+
+    chromadb and the SentenceTransformer model are only imported and loaded when first needed,
+    so importing this module stays cheap. warm_up() can do that work on a background thread.
+    """
+
+    def __init__(self, path: str = CHROMA_PATH, collection_name: str = COLLECTION_NAME,
+                 model_name: str = EMBEDDING_MODEL, bm25_path: str = BM25_INDEX_PATH,
+                 lexical_store_path: str = LEXICAL_STORE_PATH, use_quantized_index: bool = USE_QUANTIZED_INDEX,
+                 quantized_index_path: str = QUANTIZED_INDEX_PATH, shard_by_source: bool = SHARD_BY_SOURCE,
+                 manifest_path: str = MANIFEST_PATH):
+        self.path = path
+        self.collection_name = collection_name
+        self.model_name = model_name
+        self.bm25_path = bm25_path
+        self.lexical_store_path = lexical_store_path
+        self.use_quantized_index = use_quantized_index
+        self.quantized_index_path = quantized_index_path
+        self.manifest_path = manifest_path
+        self.shard_by_source = shard_by_source
+        self._shards = {}
+        self._lock = threading.RLock()
+        self._client = None
+        self._embedding_function = None
+        self._model_embedding_function = None
+        self._collection = None
+        self._bm25 = None
+        self._lexical_store = None
+        self._quantized_index = None
+        self._quantized_version = None
+        # Bumped by every write so cached retrieval results never outlive the data they came from
+        self.version = 0
+        self.query_cache = QueryCache()
+        # Query embeddings stay in memory so user queries never reach the on-disk chunk cache
+        self.query_embeddings = QueryCache(max_entries=4096)
+
+    def bump_version(self):
+        """Mark the collection as changed, invalidating cached retrieval results"""
+        with self._lock:
+            self.version += 1
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import chromadb
+                    # Initialize ChromaDB client with persistence
+                    self._client = chromadb.PersistentClient(path=self.path)
+        return self._client
+
+    @property
+    def embedding_function(self):
+        if self._embedding_function is None:
+            with self._lock:
+                if self._embedding_function is None:
+                    from chromadb.utils import embedding_functions
+                    from embedding_cache import CachedEmbeddingFunction
+                    # Configure sentence transformer embeddings, cached on disk across re-ingests
+                    self._model_embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
+                        model_name=self.model_name
+                    )
+                    self._embedding_function = CachedEmbeddingFunction(self._model_embedding_function, self.model_name)
+        return self._embedding_function
+
+    @property
+    def model_embedding_function(self):
+        """The plain sentence transformer function, as persisted with the collection by Chroma.
+
+        Collections are opened with this one so existing databases keep matching their stored
+        embedding function config; every write and query passes precomputed embeddings anyway.
+        """
+        self.embedding_function
+        return self._model_embedding_function
+
+    def embed_queries(self, queries):
+        """Embed search queries with the wrapped model, bypassing the persistent chunk-embedding cache"""
+        queries = list(queries)
+        embeddings = [self.query_embeddings.get(query) for query in queries]
+        missing = list(dict.fromkeys(query for query, embedding in zip(queries, embeddings) if embedding is None))
+        if missing:
+            computed = dict(zip(missing, self.embedding_function.embedding_function(missing)))
+            for query, embedding in computed.items():
+                self.query_embeddings.put(query, np.asarray(embedding, dtype=np.float32))
+            embeddings = [embedding if embedding is not None else np.asarray(computed[query], dtype=np.float32)
+                          for query, embedding in zip(queries, embeddings)]
+        return embeddings
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    # Create or get existing collection
+                    self._collection = self.client.get_or_create_collection(
+                        name=self.collection_name,
+                        embedding_function=self.model_embedding_function
+                    )
+        return self._collection
+
+    @property
+    def bm25(self):
+        if self._bm25 is None:
+            with self._lock:
+                if self._bm25 is None:
+                    index = BM25Index.load(self.bm25_path)
+                    if not len(index) and self.collection.count():
+                        # Collections built before the lexical index existed
+                        rebuild_lexical_index(self.collection, index)
+                        index.save()
+                    self._bm25 = index
+        return self._bm25
+
+    @property
+    def lexical_store(self):
+        if self._lexical_store is None:
+            with self._lock:
+                if self._lexical_store is None:
+                    store = LexicalStore(self.lexical_store_path)
+                    if not len(store) and self.collection.count():
+                        rebuild_lexical_index(self.collection, store)
+                    self._lexical_store = store
+        return self._lexical_store
+
+    def shard(self, source: str):
+        """Return the sub-collection holding one source's chunks, back-filling it on first use"""
+        shard = self._shards.get(source)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.get(source)
+                if shard is None:
+                    shard = self.client.get_or_create_collection(
+                        name=self._shard_name(source),
+                        embedding_function=self.model_embedding_function,
+                        metadata={"source": source}
+                    )
+                    if not shard.count():
+                        existing = self.collection.get(
+                            where={"source": source}, include=["embeddings", "documents", "metadatas"]
+                        )
+                        if existing["ids"]:
+                            shard.upsert(**{key: existing[key] for key in
+                                            ("ids", "embeddings", "documents", "metadatas")})
+                    self._shards[source] = shard
+        return shard
+
+    def drop_shard(self, source: str):
+        """Delete the sub-collection of a source that has left the index"""
+        with self._lock:
+            self._shards.pop(source, None)
+            try:
+                self.client.delete_collection(self._shard_name(source))
+            except Exception:
+                # Never created, e.g. the source was removed before it was ever searched
+                pass
+
+    def _shard_name(self, source: str):
+        # Collection names are restricted, so shards are named by a hash of the source
+        digest = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+        return f"{self.collection_name}__{digest}"
+
+    @property
+    def quantized_index(self):
+        """The quantized index, or None when it is disabled or older than the collection"""
+        if not self.use_quantized_index:
+            return None
+        if self._quantized_index is None:
+            self.refresh_quantized_index()
+        if self._quantized_version != self.version:
+            return None
+        return self._quantized_index
+
+    def refresh_quantized_index(self, manifest_path: str = None):
+        """Load the quantized index, rebuilding it if it does not match the collection.
+
+        An index on disk is only reused if it was built from the files the ingest manifest lists now,
+        so edits made while the index was off, or lost to a crash, are never served from a stale copy.
+        A rebuild re-reads and rewrites every vector in the collection, so each sync that changes
+        anything (including a single file picked up by the watcher) costs a full pass over the index.
+        """
+        if not self.use_quantized_index:
+            return
+        with self._lock:
+            if self._quantized_index is not None and self._quantized_version == self.version:
+                return
+            fingerprint = manifest_fingerprint(load_manifest(manifest_path or self.manifest_path))
+            index = None
+            if self._quantized_index is None and QuantizedIndex.exists(self.quantized_index_path):
+                index = QuantizedIndex(self.quantized_index_path)
+                if index.fingerprint != fingerprint or len(index) != self.collection.count():
+                    index = None
+            if index is None:
+                index = QuantizedIndex.build(self.collection, self.quantized_index_path, fingerprint=fingerprint)
+            self._quantized_index = index
+            self._quantized_version = self.version
+
+    def warm_up(self, background: bool = True):
+        """Open the collection and run one embedding so the first query does not pay for it"""
+        def load():
+            try:
+                self.bm25
+                self.lexical_store
+                self.refresh_quantized_index()
+                self.embedding_function.embedding_function(["warm up"])
+            except Exception as e:
+                print(f"Error warming up RAG engine: {str(e)}")
+
+        if not background:
+            load()
+            return None
+        thread = threading.Thread(target=load, name="rag-engine-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+@lru_cache(maxsize=None)
+def get_engine():
+    """Return the process-wide RAG engine"""
+    return RagEngine()
+
+def get_collection():
+    """Return the document collection, initializing the engine if needed"""
+    return get_engine().collection
+
+def __getattr__(name):
+    # Keep `from chroma_utils import collection` working without initializing on import
+    if name == "client":
+        return get_engine().client
+    if name == "collection":
+        return get_engine().collection
+    if name == "sentence_transformer_ef":
+        return get_engine().embedding_function
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+_sync_lock = threading.Lock()
+_search_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="search")
+
+def _batch_writer(collection, batch_size: int = EMBED_BATCH_SIZE):
+    from embedding_pipeline import BatchWriter
+    engine = get_engine()
+    return BatchWriter(collection, engine.embedding_function, batch_size,
+                       lexical_indexes=(engine.bm25, engine.lexical_store), on_write=engine.bump_version,
+                       shard_for=engine.shard if engine.shard_by_source else None)
+
+def rebuild_lexical_index(collection, index, page_size: int = 1000):
+    """Index every chunk already stored in the collection"""
+    for offset in range(0, collection.count(), page_size):
+        page = collection.get(include=["documents"], limit=page_size, offset=offset)
+        index.add(page["ids"], page["documents"])
+
+def chunk_source(chunk_id: str):
+    """Recover the source of a chunk from its id"""
+    return chunk_id.rpartition("_chunk_")[0]
+
+def _group_by_source(ids):
+    groups = {}
+    for i, chunk_id in enumerate(ids):
+        groups.setdefault(chunk_source(chunk_id), []).append(i)
+    return groups.items()
+
+def delete_chunks(collection, ids):
+    """Delete chunks from the collection, its shards and the lexical indexes"""
+    if not ids:
+        return
+    collection.delete(ids=ids)
+    engine = get_engine()
+    if engine.shard_by_source:
+        for source, rows in _group_by_source(ids):
+            engine.shard(source).delete(ids=[ids[i] for i in rows])
+    engine.bm25.remove(ids)
+    engine.lexical_store.remove(ids)
+    engine.bump_version()
+
+def update_chunk_metadata(collection, ids, metadatas):
+    """Replace the metadata of stored chunks in the collection and its shards"""
+    collection.update(ids=ids, metadatas=metadatas)
+    engine = get_engine()
+    if engine.shard_by_source:
+        for source, rows in _group_by_source(ids):
+            engine.shard(source).update(ids=[ids[i] for i in rows], metadatas=[metadatas[i] for i in rows])
+    engine.bump_version()
+
+def document_source(file_path: str, root: str = None):
+    """Name a document by its path relative to the ingested folder, or by its file name"""
+    if root is None:
+        return os.path.basename(file_path)
+    return os.path.relpath(file_path, root).replace(os.sep, "/")
+
+def iter_document_batches(file_path: str, batch_size: int = EMBED_BATCH_SIZE, source: str = None):
+    """Stream a document as (ids, chunks, metadatas) batches while it is still being read"""
+    file_name = source or os.path.basename(file_path)
+    ids, chunks, metadatas = [], [], []
+
+    for i, (start, end, chunk) in enumerate(iter_chunks(iter_document(file_path))):
+        ids.append(f"{file_name}_chunk_{i}")
+        chunks.append(chunk)
+        metadatas.append({"source": file_name, "chunk": i, "start": start, "end": end})
+        if len(chunks) == batch_size:
+            yield ids, chunks, metadatas
+            ids, chunks, metadatas = [], [], []
+
+    if chunks:
+        yield ids, chunks, metadatas
 def process_document(file_path: str):
     """Process a single document and prepare it for ChromaDB"""
+    ids, chunks, metadatas = [], [], []
     try:
-        # Read the document
-        content = read_document(file_path)
-
-        # Split into chunks
-        chunks = split_text(content)
-
-        # Prepare metadata
-        file_name = os.path.basename(file_path)
-        metadatas = [{"source": file_name, "chunk": i} for i in range(len(chunks))]
-        ids = [f"{file_name}_chunk_{i}" for i in range(len(chunks))]
+        for batch_ids, batch_chunks, batch_metadatas in iter_document_batches(file_path):
+            ids.extend(batch_ids)
+            chunks.extend(batch_chunks)
+            metadatas.extend(batch_metadatas)
 
         return ids, chunks, metadatas
     except Exception as e:
         print(f"Error processing {file_path}: {str(e)}")
         return [], [], []
-def add_to_collection(collection, ids, texts, metadatas):
+def document_metadata(file_path: str, spans, source: str = None):
+    """Build chunk ids and metadata for a chunked document"""
+    file_name = source or os.path.basename(file_path)
+    metadatas = [{"source": file_name, "chunk": i, "start": start, "end": end}
+                 for i, (start, end) in enumerate(spans)]
+    ids = [f"{file_name}_chunk_{i}" for i in range(len(spans))]
+    return ids, metadatas
+def add_to_collection(collection, ids, texts, metadatas, batch_size: int = EMBED_BATCH_SIZE):
     """Add documents to collection in batches"""
     if not texts:
         return
 
-    batch_size = 100
-    for i in range(0, len(texts), batch_size):
-        end_idx = min(i + batch_size, len(texts))
-        collection.add(
-            documents=texts[i:end_idx],
-            metadatas=metadatas[i:end_idx],
-            ids=ids[i:end_idx]
-        )
+    # Upserts with precomputed embeddings keep re-ingesting the same file idempotent
+    with _batch_writer(collection, batch_size) as writer:
+        writer.add(ids, texts, metadatas)
+
+@contextmanager
+def multi_process_embeddings(processes: int = None):
+    """Embed large ingest batches across CPU processes for the duration of the block"""
+    from embedding_pipeline import MultiProcessEmbeddingFunction
+    cached_ef = get_engine().embedding_function
+    previous = cached_ef.embedding_function
+    encoder = MultiProcessEmbeddingFunction(EMBEDDING_MODEL, processes)
+    cached_ef.embedding_function = encoder
+    try:
+        yield encoder
+    finally:
+        cached_ef.embedding_function = previous
+        encoder.close()
+
+def snapshot_documents(folder_path: str):
+    """Map every supported document under a folder, recursively, to its (size, mtime_ns)"""
+    snapshot = {}
+    for dir_path, dir_names, file_names in os.walk(folder_path):
+        # Skip hidden folders such as .git
+        dir_names[:] = [name for name in dir_names if not name.startswith('.')]
+        for file_name in file_names:
+            if file_name.startswith('.') or not file_name.lower().endswith(SUPPORTED_EXTENSIONS):
+                continue
+            file_path = os.path.join(dir_path, file_name)
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                # Deleted between listing and stat
+                continue
+            snapshot[file_path] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+def list_documents(folder_path: str):
+    """List the documents under a folder, recursively, in a stable order"""
+    return sorted(snapshot_documents(folder_path))
 
-def process_and_add_documents(collection, folder_path: str):
+def process_and_add_documents(collection, folder_path: str, workers: int = 1):
     """Process all documents in a folder and add to collection"""
-    files = [os.path.join(folder_path, file) 
-             for file in os.listdir(folder_path) 
-             if os.path.isfile(os.path.join(folder_path, file))]
+    timings = ingest_files(collection, list_documents(folder_path), workers, root=folder_path)
+    get_engine().bm25.save()
+    return timings
 
+def ingest_files(collection, files, workers: int = 1, root: str = None, deduplicate: bool = True):
+    """Ingest files into the collection, returning (file_path, chunk_ids, parse_s, write_s) per ingested file"""
+    if workers > 1 and len(files) > 1:
+        return process_and_add_documents_parallel(collection, files, workers, root=root, deduplicate=deduplicate)
+
+    timings = []
     for file_path in files:
-        print(f"Processing {os.path.basename(file_path)}...")
-        ids, texts, metadatas = process_document(file_path)
-        add_to_collection(collection, ids, texts, metadatas)
-        print(f"Added {len(texts)} chunks to collection")
+        source = document_source(file_path, root)
+        print(f"Processing {source}...")
+        start = time.perf_counter()
+        chunk_ids = []
+        # Boilerplate repeats within a document; deduplicating per file keeps deletes per file safe
+        dedup = ChunkDeduplicator(DEDUP_THRESHOLD) if deduplicate else None
+        try:
+            # Chunks are embedded and stored while later pages are still being parsed
+            with _batch_writer(collection) as writer:
+                for ids, texts, metadatas in iter_document_batches(file_path, source=source):
+                    if dedup:
+                        ids, texts, metadatas = dedup.filter(ids, texts, metadatas)
+                    writer.add(ids, texts, metadatas)
+                    chunk_ids.extend(ids)
+            if dedup:
+                # Kept chunks may have absorbed duplicates after they were written
+                collapsed_ids, collapsed_metadatas = dedup.collapsed()
+                if collapsed_ids:
+                    update_chunk_metadata(collection, collapsed_ids, collapsed_metadatas)
+        except Exception as e:
+            print(f"Error processing {file_path}: {str(e)}")
+            continue
+        timings.append((file_path, chunk_ids, time.perf_counter() - start, 0.0))
+        print(f"Added {len(chunk_ids)} chunks to collection{_dedup_summary(dedup)}")
+    return timings
+
+def _dedup_summary(dedup):
+    if not dedup or not dedup.dropped:
+        return ""
+    stats = dedup.stats()
+    return f" ({stats['dropped']} near-duplicates dropped, {stats['reduction']:.0%} smaller)"
+
+def _write_documents(collection, pending: queue.Queue, timings: list, root: str = None, deduplicate: bool = True):
+    """Drain parsed documents from the queue into the collection, in arrival order"""
+    while True:
+        item = pending.get()
+        if item is None:
+            break
+        file_path, chunks, spans, parse_seconds = item
+        start = time.perf_counter()
+        source = document_source(file_path, root)
+        try:
+            ids, metadatas = document_metadata(file_path, spans, source)
+            dedup = ChunkDeduplicator(DEDUP_THRESHOLD) if deduplicate else None
+            if dedup:
+                ids, chunks, metadatas = dedup.filter(ids, chunks, metadatas)
+            add_to_collection(collection, ids, chunks, metadatas)
+        except Exception as e:
+            print(f"Error adding {file_path}: {str(e)}")
+            continue
+        write_seconds = time.perf_counter() - start
+        timings.append((file_path, ids, parse_seconds, write_seconds))
+        print(f"Added {len(chunks)} chunks from {source} "
+              f"(parse {parse_seconds:.2f}s, write {write_seconds:.2f}s){_dedup_summary(dedup)}")
+
+def process_and_add_documents_parallel(collection, files, workers: int, queue_size: int = 4, root: str = None,
+                                       deduplicate: bool = True):
+    """Parse and chunk files across a process pool while a single thread writes to the collection"""
+    start = time.perf_counter()
+    timings = []
+    pending = queue.Queue(maxsize=queue_size)
+    writer = threading.Thread(target=_write_documents, args=(collection, pending, timings, root, deduplicate))
+    writer.start()
+
+    try:
+        # Forking would copy the locks held by the writer and model threads into the workers
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            in_flight = deque()
+            remaining = iter(files)
+            for file_path in remaining:
+                in_flight.append((file_path, pool.submit(chunk_document, file_path)))
+                if len(in_flight) >= workers * 2:
+                    break
+
+            # Results are consumed in submission order so collection writes stay ordered
+            while in_flight:
+                file_path, future = in_flight.popleft()
+                next_file = next(remaining, None)
+                if next_file is not None:
+                    in_flight.append((next_file, pool.submit(chunk_document, next_file)))
+                try:
+                    chunks, spans, parse_seconds = future.result()
+                except Exception as e:
+                    print(f"Error processing {file_path}: {str(e)}")
+                    continue
+                # Blocks when the writer falls behind, bounding memory held by parsed files
+                pending.put((file_path, chunks, spans, parse_seconds))
+    finally:
+        pending.put(None)
+        writer.join()
+
+    total_chunks = sum(len(t[1]) for t in timings)
+    print(f"Ingested {len(timings)} files ({total_chunks} chunks) with {workers} workers "
+          f"in {time.perf_counter() - start:.2f}s")
+    return timings
+
+def sync_documents(collection, folder_path: str, manifest_path: str = MANIFEST_PATH, workers: int = 1,
+                   snapshot: dict = None):
+    """Bring the collection in line with a folder, re-ingesting only new or changed files"""
+    # The startup sync and the background watcher must not interleave manifest updates
+    with _sync_lock:
+        return _sync_documents(collection, folder_path, manifest_path, workers, snapshot)
+
+def _sync_documents(collection, folder_path, manifest_path, workers, snapshot):
+    manifest = load_manifest(manifest_path)
+    files = manifest["files"]
+    if snapshot is None:
+        snapshot = snapshot_documents(folder_path)
+    current = sorted(snapshot)
+
+    changed = []
+    for file_path in current:
+        entry = files.get(file_path)
+        size, mtime = snapshot[file_path]
+        if entry and entry["size"] == size and entry["mtime"] == mtime:
+            continue
+        try:
+            digest = file_hash(file_path)
+        except FileNotFoundError:
+            continue
+        if entry and entry["hash"] == digest:
+            # Touched but not modified: refresh the stat fingerprint only
+            entry["size"], entry["mtime"] = size, mtime
+            continue
+        changed.append((file_path, size, mtime, digest))
+
+    removed = [path for path in files if path not in snapshot]
+    engine = get_engine()
+    for path in removed:
+        delete_chunks(collection, files[path]["chunk_ids"])
+        if engine.shard_by_source:
+            engine.drop_shard(document_source(path, folder_path))
+        del files[path]
+        print(f"Removed {os.path.basename(path)} from collection")
+
+    fingerprints = {path: (size, mtime, digest) for path, size, mtime, digest in changed}
+    try:
+        for file_path, chunk_ids, _, _ in ingest_files(collection, list(fingerprints), workers, root=folder_path):
+            size, mtime, digest = fingerprints[file_path]
+            # A shorter new revision leaves trailing chunks of the old one behind
+            stale = set(files.get(file_path, {}).get("chunk_ids", [])) - set(chunk_ids)
+            delete_chunks(collection, sorted(stale))
+            files[file_path] = {
+                "size": size,
+                "mtime": mtime,
+                "hash": digest,
+                "chunk_ids": chunk_ids,
+            }
+    finally:
+        save_manifest(manifest, manifest_path)
+        engine = get_engine()
+        engine.bm25.save()
+        engine.refresh_quantized_index(manifest_path)
+
+    print(f"Index sync: {len(changed)} new or changed, {len(removed)} removed, "
+          f"{len(current) - len(changed)} unchanged")
+    return changed, removed
 def print_search_results(results):
     """Print formatted search results"""
     print("\nSearch Results:\n" + "-" * 50)
@@ -72,45 +590,239 @@ def print_search_results(results):
         print(f"Source: {meta['source']}, Chunk {meta['chunk']}")
         print(f"Distance: {distance}")
         print(f"Content: {doc}\n")
-def semantic_search(collection, query: str, n_results: int = 10):
-    """Perform semantic search on the collection"""
-    results = collection.query(
-        query_texts=[query],
-        n_results=n_results,
-        include=["documents", "metadatas", "distances"]
+def semantic_search(collection, query: str, n_results: int = 10, method: str = "rrf", where: dict = None,
+                    mmr_lambda: float = None, fetch_k: int = None):
+    """Perform hybrid search on the collection, returning the top n_results (doc, score, meta).
+
+    where is a Chroma metadata filter, e.g. source_filter("policy.pdf", 0, 20), applied to both retrievers.
+    With mmr_lambda, n_results diverse chunks are picked from the top fetch_k by maximal marginal relevance.
+    """
+    return semantic_search_many(collection, [query], n_results, method, where=where,
+                                mmr_lambda=mmr_lambda, fetch_k=fetch_k)[0]
+
+def semantic_search_many(collection, queries, n_results: int = 10, method: str = "rrf",
+                         batch_size: int = QUERY_BATCH_SIZE, where: dict = None,
+                         mmr_lambda: float = None, fetch_k: int = None):
+    """Search many queries at once, embedding them in batches and sending one multi-query call per batch"""
+    if method not in ("rrf", "overlap"):
+        raise ValueError(f"Unsupported search method: {method}")
+    if mmr_lambda is not None:
+        pool_size = max(fetch_k or n_results * MMR_POOL_FACTOR, n_results)
+        pools = semantic_search_many(collection, queries, pool_size, method, batch_size, where)
+        return _diversify(collection, queries, pools, n_results, mmr_lambda)
+
+    engine = get_engine()
+    cache = engine.query_cache
+    where_key = json.dumps(where, sort_keys=True) if where else None
+    keys = [(normalize_query(query), n_results, method, where_key, engine.version) for query in queries]
+    results = [cache.get(key) for key in keys]
+
+    # Only cache misses are embedded and searched
+    pending = list({key[0]: (key, query) for key, query, result in zip(keys, queries, results)
+                    if result is None}.values())
+    found = {}
+    for i in range(0, len(pending), batch_size):
+        batch_keys = [key for key, _ in pending[i:i + batch_size]]
+        batch = [query for _, query in pending[i:i + batch_size]]
+        if method == "overlap":
+            batch_results = _overlap_search(collection, batch, n_results, where)
+        else:
+            batch_results = _hybrid_search(collection, batch, n_results, where)
+        for key, result in zip(batch_keys, batch_results):
+            cache.put(key, result)
+            found[key] = result
+
+    return [result if result is not None else found[key] for key, result in zip(keys, results)]
+
+def _diversify(collection, queries, pools, n_results: int, mmr_lambda: float):
+    """Select n_results chunks from each candidate pool by maximal marginal relevance"""
+    ids = list({f"{meta['source']}_chunk_{meta['chunk']}" for pool in pools for _, _, meta in pool})
+    if not ids:
+        return pools
+    stored = collection.get(ids=ids, include=["embeddings"])
+    embeddings = dict(zip(stored["ids"], stored["embeddings"]))
+    query_embeddings = get_engine().embed_queries(queries)
+
+    diversified = []
+    for query_embedding, pool in zip(query_embeddings, pools):
+        pool = [hit for hit in pool if f"{hit[2]['source']}_chunk_{hit[2]['chunk']}" in embeddings]
+        if len(pool) <= n_results:
+            diversified.append(pool)
+            continue
+        candidates = np.stack([embeddings[f"{meta['source']}_chunk_{meta['chunk']}"] for _, _, meta in pool])
+        diversified.append([pool[i] for i in mmr_select(query_embedding, candidates, n_results, mmr_lambda)])
+    return diversified
+
+def source_filter(source: str, first_chunk: int = None, last_chunk: int = None):
+    """Build a where clause restricting a search to one source and, optionally, a chunk range"""
+    clauses = [{"source": source}]
+    if first_chunk is not None:
+        clauses.append({"chunk": {"$gte": first_chunk}})
+    if last_chunk is not None:
+        clauses.append({"chunk": {"$lte": last_chunk}})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def _scoped_source(where):
+    """Return the single source a where clause is restricted to, if any"""
+    if not where:
+        return None
+    if "$and" in where:
+        for clause in where["$and"]:
+            source = _scoped_source(clause)
+            if source is not None:
+                return source
+        return None
+    value = where.get("source") if len(where) == 1 else None
+    if isinstance(value, dict) and list(value) == ["$eq"]:
+        value = value["$eq"]
+    return value if isinstance(value, str) else None
+
+def _search_target(collection, where):
+    """Pick the collection to search: a source's shard when the filter is scoped to one source"""
+    engine = get_engine()
+    source = _scoped_source(where)
+    if source is not None and engine.shard_by_source:
+        return engine.shard(source)
+    return collection
+
+def _vector_query(collection, queries, n_results: int, include, where: dict = None):
+    engine = get_engine()
+    embeddings = engine.embed_queries(queries)
+    if where:
+        # The quantized index holds no metadata, so filtered searches go to Chroma
+        return _search_target(collection, where).query(
+            query_embeddings=embeddings, n_results=n_results, include=include, where=where
+        )
+    index = engine.quantized_index
+    if index is not None:
+        return index.query(collection, embeddings, n_results, include)
+    return collection.query(query_embeddings=embeddings, n_results=n_results, include=include)
+
+def _hybrid_search(collection, queries, n_results: int, where: dict = None):
+    candidates = max(n_results, RETRIEVAL_CANDIDATES)
+    # The vector and lexical indexes are queried in parallel
+    vector_future = _search_executor.submit(
+        _vector_query, collection, queries, candidates, ["documents", "metadatas"], where
     )
-    docs = list(zip(
-    results["documents"][0],
-    results["distances"][0],
-    results["metadatas"][0]
-))
-    ranked = []
+    allowed_ids = set(_search_target(collection, where).get(where=where, include=[])["ids"]) if where else None
+    bm25 = get_engine().bm25
+    lexical_hits = [bm25.search(query, candidates, allowed_ids) for query in queries]
+    results = vector_future.result()
 
-    for doc, dist, meta in docs:
-        kw_score = keyword_overlap_score(doc, query)
-        score = hybrid_score(dist, kw_score)
-        ranked.append((doc, score, meta))
+    chunks = {}
+    rankings = []
+    for q in range(len(queries)):
+        chunks.update(zip(results["ids"][q], zip(results["documents"][q], results["metadatas"][q])))
+        ranked = reciprocal_rank_fusion([results["ids"][q], [chunk_id for chunk_id, _ in lexical_hits[q]]])
+        rankings.append(ranked[:n_results])
 
-    ranked.sort(key=lambda x: x[1], reverse=True)
-    top_k_docs = ranked[:3]
+    # Chunks found only by BM25 are fetched in one call for the whole batch
+    missing = list({chunk_id for ranked in rankings for chunk_id, _ in ranked if chunk_id not in chunks})
+    if missing:
+        fetched = collection.get(ids=missing, include=["documents", "metadatas"])
+        chunks.update(zip(fetched["ids"], zip(fetched["documents"], fetched["metadatas"])))
 
-    return top_k_docs
- 
-def get_context_with_sources(results):
-    """Extract context and source information from search results"""
-    # Combine document chunks into a single context
-    docs_col_0 = [item[0] for item in results]
-    meta_col_2 = [item[2] for item in results]
-    context = "\n\n".join(docs_col_0)
+    return [
+        [(chunks[chunk_id][0], score, chunks[chunk_id][1]) for chunk_id, score in ranked if chunk_id in chunks]
+        for ranked in rankings
+    ]
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K):
+    """Fuse ranked id lists into (id, score) pairs sorted by descending sum of 1 / (k + rank)"""
+    positions = {}
+    columns, weights = [], []
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            columns.append(positions.setdefault(chunk_id, len(positions)))
+            weights.append(rank)
+    scores = np.zeros(len(positions))
+    np.add.at(scores, np.asarray(columns, dtype=np.intp), 1.0 / (k + np.asarray(weights, dtype=np.float64)))
+    # Stable, so ties keep first-seen order
+    order = np.argsort(-scores, kind="stable")
+    chunk_ids = list(positions)
+    return [(chunk_ids[i], float(scores[i])) for i in order]
+
+def _overlap_search(collection, queries, n_results: int, where: dict = None):
+    """Vector search re-scored with keyword overlap, as used before hybrid retrieval"""
+    results = _vector_query(collection, queries, max(n_results, 10), ["documents", "metadatas", "distances"],
+                            where)
+    lexical_store = get_engine().lexical_store
+    ranked = []
+    for q, query in enumerate(queries):
+        docs = results["documents"][q]
+        metas = results["metadatas"][q]
+        distances = np.asarray(results["distances"][q], dtype=np.float64)
+        # Token-id sets precomputed at ingest replace re-tokenizing every candidate
+        keyword_hits = lexical_store.overlap_counts(results["ids"][q], docs, query)
+        scores = hybrid_score(distances, keyword_hits)
+        order = np.argsort(-scores, kind="stable")[:n_results]
+        ranked.append([(docs[i], float(scores[i]), metas[i]) for i in order])
+    return ranked
  
+def get_context_with_sources(results, token_budget: int = CONTEXT_TOKEN_BUDGET):
+    """Extract context and source information from search results, fitting at most token_budget tokens"""
+    engine = get_engine()
+    key = ("context", tuple((meta["source"], meta["chunk"]) for _, _, meta in results), token_budget, engine.version)
+    cached = engine.query_cache.get(key)
+    if cached is not None:
+        return cached
+    context, sources = _build_context(results, token_budget)
+    engine.query_cache.put(key, (context, sources))
+    return context, sources
+
+def _build_context(results, token_budget: int = None):
+    """Fill the budget with hits in score order, then stitch adjacent chunks of a source into one passage"""
+    selected, used = [], 0
+    for rank, (doc, _, meta) in enumerate(results):
+        tokens = count_tokens(doc)
+        if token_budget is not None and used + tokens > token_budget:
+            continue
+        selected.append((rank, doc, meta))
+        used += tokens
+
+    passages = []
+    for rank, doc, meta in sorted(selected, key=lambda hit: (hit[2]["source"], hit[2]["chunk"])):
+        if passages and _is_adjacent(passages[-1], meta):
+            _stitch(passages[-1], doc, meta)
+            passages[-1]["rank"] = min(passages[-1]["rank"], rank)
+        else:
+            passages.append({"rank": rank, "text": doc, "source": meta["source"], "first": meta["chunk"],
+                             "last": meta["chunk"], "start": meta.get("start"), "end": meta.get("end")})
+
+    # Keep the best-scoring passage first
+    passages.sort(key=lambda passage: passage["rank"])
+    context = "\n\n".join(passage["text"] for passage in passages)
+
     # Format sources with metadata
     sources = [
-        f"{meta['source']} (chunk {meta['chunk']})"
-        for meta in meta_col_2
+        f"{passage['source']} (chunk {passage['first']})" if passage["first"] == passage["last"]
+        else f"{passage['source']} (chunks {passage['first']}-{passage['last']})"
+        for passage in passages
     ]
- 
+
     return context, sources
 
+def _is_adjacent(passage, meta):
+    """Whether a chunk continues a passage: same source and touching character offsets, or the next chunk number"""
+    if passage["source"] != meta["source"]:
+        return False
+    if passage["end"] is not None and meta.get("start") is not None:
+        return meta["start"] <= passage["end"]
+    return meta["chunk"] == passage["last"] + 1
+
+def _stitch(passage, doc, meta):
+    """Append a chunk to a passage, dropping the text the two share"""
+    if passage["end"] is not None and meta.get("start") is not None:
+        overlap = passage["end"] - meta["start"]
+    else:
+        # No offsets stored: find the longest suffix of the passage that starts the chunk
+        overlap = next((size for size in range(min(len(doc), len(passage["text"])), 0, -1)
+                        if passage["text"].endswith(doc[:size])), 0)
+    if meta.get("end") is None or passage["end"] is None or meta["end"] > passage["end"]:
+        passage["text"] += doc[overlap:]
+        passage["end"] = meta.get("end")
+    passage["last"] = meta["chunk"]
+
 def hybrid_score(distance, keyword_hits):
     return (1 - distance) * 0.7 + keyword_hits * 0.3
 def keyword_overlap_score(doc, query):
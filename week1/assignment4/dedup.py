@@ -0,0 +1,100 @@
+import re
+import zlib
+import numpy as np
+
+_WORD = re.compile(r"\w+")
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+# Chroma metadata values must be scalars, so collapsed sources are stored as a bounded string
+MAX_DUPLICATE_SOURCES = 20
+
+class ChunkDeduplicator:
+    """Drop near-duplicate chunks using MinHash signatures and LSH banding.
+
+    A chunk whose estimated Jaccard similarity to an earlier kept chunk reaches the threshold is
+    dropped, and its source is recorded on the kept chunk's metadata. State is kept across calls to
+    filter(), so one instance can deduplicate a document streamed in batches.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, bands: int = 32,
+                 shingle_size: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        rng = np.random.default_rng(seed)
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.rows = num_perm // bands
+        self._a = rng.integers(1, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._buckets = {}
+        self._signatures = []
+        self._kept_ids = []
+        self._kept_metadatas = []
+        self.seen = 0
+        self.dropped = 0
+
+    def signature(self, text: str):
+        """Return the MinHash signature of a text's word shingles"""
+        words = _WORD.findall(text.lower())
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64,
+                             count=len(shingles)) % _MERSENNE_PRIME
+        # (a * h + b) mod p for every permutation and shingle, then the minimum per permutation
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME).min(axis=1)
+
+    def filter(self, ids, texts, metadatas):
+        """Return the ids, texts and metadatas of the chunks that are not near-duplicates"""
+        kept_ids, kept_texts, kept_metadatas = [], [], []
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            self.seen += 1
+            signature = self.signature(text)
+            bands = [signature[i:i + self.rows].tobytes() for i in range(0, len(signature), self.rows)]
+            original = self._find_duplicate(signature, bands)
+            if original is not None:
+                self._record_duplicate(self._kept_metadatas[original], metadata)
+                self.dropped += 1
+                continue
+
+            index = len(self._signatures)
+            self._signatures.append(signature)
+            self._kept_ids.append(chunk_id)
+            self._kept_metadatas.append(metadata)
+            for band, key in enumerate(bands):
+                self._buckets.setdefault((band, key), []).append(index)
+            kept_ids.append(chunk_id)
+            kept_texts.append(text)
+            kept_metadatas.append(metadata)
+        return kept_ids, kept_texts, kept_metadatas
+
+    def _find_duplicate(self, signature, bands):
+        candidates = set()
+        for band, key in enumerate(bands):
+            candidates.update(self._buckets.get((band, key), ()))
+        best, best_similarity = None, self.threshold
+        for index in candidates:
+            similarity = float(np.mean(self._signatures[index] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = index, similarity
+        return best
+
+    def _record_duplicate(self, kept, duplicate):
+        kept["duplicate_count"] = kept.get("duplicate_count", 0) + 1
+        if kept["duplicate_count"] <= MAX_DUPLICATE_SOURCES:
+            reference = f"{duplicate['source']}#{duplicate['chunk']}"
+            previous = kept.get("duplicate_sources")
+            kept["duplicate_sources"] = f"{previous}, {reference}" if previous else reference
+
+    def collapsed(self):
+        """Return the ids and metadatas of kept chunks that absorbed duplicates"""
+        pairs = [(chunk_id, metadata) for chunk_id, metadata in zip(self._kept_ids, self._kept_metadatas)
+                 if "duplicate_count" in metadata]
+        return [chunk_id for chunk_id, _ in pairs], [metadata for _, metadata in pairs]
+
+    def stats(self):
+        """Return how many chunks were seen and dropped"""
+        return {
+            "chunks": self.seen,
+            "kept": self.seen - self.dropped,
+            "dropped": self.dropped,
+            "reduction": self.dropped / self.seen if self.seen else 0.0,
+        }
@@ -1,82 +1,176 @@
 import docx
 import PyPDF2
 import os
+import re
+import time
+from collections import deque
+
+SUPPORTED_EXTENSIONS = ('.txt', '.pdf', '.docx')
  
 def read_text_file(file_path: str):
     """Read content from a text file"""
     with open(file_path, 'r', encoding='utf-8') as file:
         return file.read()
  
-def read_pdf_file(file_path: str):
-    """Read content from a PDF file"""
-    text = ""
+def iter_pdf_pages(file_path: str):
+    """Yield the text of a PDF one page at a time"""
     with open(file_path, 'rb') as file:
         pdf_reader = PyPDF2.PdfReader(file)
         for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-    return text
+            yield (page.extract_text() or "") + "\n"
+
+def read_pdf_file(file_path: str):
+    """Read content from a PDF file"""
+    return "".join(iter_pdf_pages(file_path))
  
 def read_docx_file(file_path: str):
     """Read content from a Word document"""
     doc = docx.Document(file_path)
     return "\n".join([paragraph.text for paragraph in doc.paragraphs])
  
-def read_document(file_path: str):
-    """Read document content based on file extension"""
+def iter_text_file(file_path: str, block_size: int = 64 * 1024):
+    """Yield the content of a text file in fixed-size blocks"""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        while True:
+            block = file.read(block_size)
+            if not block:
+                break
+            yield block
+
+def iter_docx_file(file_path: str):
+    """Yield the paragraphs of a Word document"""
+    doc = docx.Document(file_path)
+    for i, paragraph in enumerate(doc.paragraphs):
+        yield paragraph.text if i == 0 else "\n" + paragraph.text
+
+def iter_document(file_path: str):
+    """Yield document content block by block based on file extension"""
     _, file_extension = os.path.splitext(file_path)
     file_extension = file_extension.lower()
- 
+
     if file_extension == '.txt':
-        return read_text_file(file_path)
+        return iter_text_file(file_path)
     elif file_extension == '.pdf':
-        return read_pdf_file(file_path)
+        return iter_pdf_pages(file_path)
     elif file_extension == '.docx':
-        return read_docx_file(file_path)
+        return iter_docx_file(file_path)
     else:
         raise ValueError(f"Unsupported file format: {file_extension}")
+
+def read_document(file_path: str):
+    """Read document content based on file extension"""
+    return "".join(iter_document(file_path))
  
-def split_text(text: str, chunk_size: int = 500,overlap_size: int = 50):
-    """Split text into chunks while preserving sentence boundaries"""
-    sentences = text.replace('\n', ' ').split('. ')
-    chunks = []
-    current_chunk = []
-    current_size = 0
- 
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
- 
-        # Ensure proper sentence ending
-        if not sentence.endswith('.'):
-            sentence += '.'
- 
-        sentence_size = len(sentence)
- 
-        # Check if adding this sentence would exceed chunk size
-        if current_size + sentence_size > chunk_size and current_chunk:
-            chunks.append(' '.join(current_chunk))
-            overlap = []
-            total = 0
+_SENTENCE_END = re.compile(r'\.\s+')
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text: str):
+    """Approximate the token count of a text as words plus punctuation marks"""
+    return len(_TOKEN.findall(text))
+
+class SpanChunker:
+    """Single-pass sentence chunker that emits (start, end) character spans instead of copied strings.
+
+    Text can be fed incrementally; only the sentences of the chunk being built are kept in memory.
+    Sizes are measured in characters or, with unit="tokens", with count_tokens.
+    """
+
+    def __init__(self, chunk_size: int = 500, overlap_size: int = 50, unit: str = "chars"):
+        if unit not in ("chars", "tokens"):
+            raise ValueError(f"Unsupported chunk unit: {unit}")
+        self.chunk_size = chunk_size
+        self.overlap_size = overlap_size
+        self._measure = count_tokens if unit == "tokens" else None
+        self._buffer = ""
+        self._base = 0   # absolute offset of self._buffer[0]
+        self._scan = 0   # absolute offset where the next unfinished sentence starts
+        self._window = deque()  # (start, end, size) of the sentences in the current chunk
+        self._size = 0
+
+    def feed(self, text: str):
+        """Append text and yield the spans of the chunks it completes"""
+        self._buffer += text
+        for match in _SENTENCE_END.finditer(self._buffer, self._scan - self._base):
+            yield from self._add(self._scan, self._base + match.start() + 1)
+            self._scan = self._base + match.end()
+        self._compact()
 
-            for sentence in reversed(current_chunk):
-                total += len(sentence)
-                overlap.insert(0, sentence)
-                if total >= overlap_size:
+    def finish(self):
+        """Flush the trailing sentence and yield the last chunk"""
+        end = self._base + len(self._buffer)
+        yield from self._add(self._scan, end)
+        self._scan = end
+        if self._window:
+            yield self._window[0][0], self._window[-1][1]
+            self._window.clear()
+            self._size = 0
+
+    def text(self, start: int, end: int):
+        """Return the text of a span emitted by the latest feed or finish call"""
+        return self._buffer[start - self._base:end - self._base]
+
+    def _add(self, start: int, end: int):
+        buffer, base = self._buffer, self._base
+        while start < end and buffer[start - base].isspace():
+            start += 1
+        while end > start and buffer[end - 1 - base].isspace():
+            end -= 1
+        if start == end:
+            return
+
+        size = end - start if self._measure is None else self._measure(buffer[start - base:end - base])
+        if self._size + size > self.chunk_size and self._window:
+            yield self._window[0][0], self._window[-1][1]
+            # Keep the shortest tail of sentences that covers the overlap
+            kept = 0
+            total = 0
+            for _, _, sentence_size in reversed(self._window):
+                kept += 1
+                total += sentence_size
+                if total >= self.overlap_size:
                     break
-            current_chunk = overlap + [sentence]
-            current_size = sum(len(s) for s in current_chunk)
-     
-        else:
-            current_chunk.append(sentence)
-            current_size += sentence_size
- 
-    # Add the last chunk if it exists
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
- 
-    return chunks
- 
- 
+            while len(self._window) > kept:
+                self._size -= self._window.popleft()[2]
+
+        self._window.append((start, end, size))
+        self._size += size
+
+    def _compact(self):
+        keep_from = self._window[0][0] if self._window else self._scan
+        if keep_from > self._base:
+            self._buffer = self._buffer[keep_from - self._base:]
+            self._base = keep_from
+
+def chunk_spans(text: str, chunk_size: int = 500, overlap_size: int = 50, unit: str = "chars"):
+    """Return (start, end) character spans of sentence-aligned chunks of text"""
+    chunker = SpanChunker(chunk_size, overlap_size, unit)
+    spans = list(chunker.feed(text))
+    spans.extend(chunker.finish())
+    return spans
+
+def split_text(text: str, chunk_size: int = 500,overlap_size: int = 50, unit: str = "chars"):
+    """Split text into chunks while preserving sentence boundaries"""
+    return [text[start:end] for start, end in chunk_spans(text, chunk_size, overlap_size, unit)]
+
+def iter_chunks(blocks, chunk_size: int = 500, overlap_size: int = 50, unit: str = "chars"):
+    """Yield (start, end, text) chunks from an iterable of text blocks, holding at most one chunk in memory"""
+    chunker = SpanChunker(chunk_size, overlap_size, unit)
+    for block in blocks:
+        for start, end in chunker.feed(block):
+            yield start, end, chunker.text(start, end)
+    for start, end in chunker.finish():
+        yield start, end, chunker.text(start, end)
+
+def split_text_stream(blocks, chunk_size: int = 500, overlap_size: int = 50, unit: str = "chars"):
+    """Yield chunk texts from an iterable of text blocks"""
+    for _, _, chunk in iter_chunks(blocks, chunk_size, overlap_size, unit):
+        yield chunk
 
- 
\ No newline at end of file
+def chunk_document(file_path: str, chunk_size: int = 500, overlap_size: int = 50, unit: str = "chars"):
+    """Read and chunk a document, returning the chunks, their spans and the seconds it took"""
+    start = time.perf_counter()
+    chunks, spans = [], []
+    for chunk_start, chunk_end, chunk in iter_chunks(iter_document(file_path), chunk_size, overlap_size, unit):
+        chunks.append(chunk)
+        spans.append((chunk_start, chunk_end))
+    return chunks, spans, time.perf_counter() - start
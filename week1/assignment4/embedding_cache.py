@@ -0,0 +1,103 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+# Stored next to chroma_db; safe to delete, it is rebuilt on demand
+EMBEDDING_CACHE_PATH = "embedding_cache.sqlite"
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """Embedding function wrapper that persists embeddings in SQLite keyed by (model name, text hash).
+
+    Only texts missing from the cache are sent to the wrapped embedding function. The cache holds at
+    most max_entries vectors and evicts the least recently used ones beyond that.
+    """
+
+    def __init__(self, embedding_function, model_name: str, path: str = EMBEDDING_CACHE_PATH,
+                 max_entries: int = 500_000):
+        self.embedding_function = embedding_function
+        self.model_name = model_name
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _key(self, text: str):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        keys = [self._key(text) for text in input]
+        now = time.time_ns()
+        found = {}
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+            if found:
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+
+        # Duplicate texts within one call are embedded once
+        missing = {}
+        for key, text in zip(keys, input):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.embedding_function(list(missing.values()))
+            computed = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(missing, vectors)}
+            found.update(computed)
+            self._store(computed, now)
+
+        return [found[key] for key in keys]
+
+    def _store(self, vectors: dict, now: int):
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, vector.tobytes(), now) for key, vector in vectors.items()],
+            )
+            self._count += self._conn.total_changes - before
+            overflow = self._count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self._count -= overflow
+                self.evictions += overflow
+            self._conn.commit()
+
+    def stats(self):
+        """Return hit/miss counters and the number of cached vectors"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": self._count,
+        }
@@ -0,0 +1,121 @@
+import atexit
+import os
+from concurrent.futures import ThreadPoolExecutor
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+class MultiProcessEmbeddingFunction(EmbeddingFunction):
+    """SentenceTransformer embedding function that spreads large inputs across a pool of CPU processes.
+
+    Small inputs such as single queries are encoded in-process, and the pool is only started by the
+    first input of at least min_parallel texts, so a warm start with nothing to embed never pays for it.
+    """
+
+    def __init__(self, model_name: str, processes: int = None, batch_size: int = 64, min_parallel: int = 256):
+        self.model_name = model_name
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.min_parallel = min_parallel
+        self._model = None
+        self._pool = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        if len(texts) < self.min_parallel or self.processes < 2:
+            return list(self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True))
+
+        if self._pool is None:
+            self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.processes)
+            atexit.register(self.close)
+        return list(self.model.encode_multi_process(texts, self._pool, batch_size=self.batch_size))
+
+    def close(self):
+        """Stop the worker processes, if they were started"""
+        if self._pool is not None:
+            self._model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+class BatchWriter:
+    """Embed chunks up front in large batches and write them with precomputed embeddings.
+
+    Each batch is embedded on the calling thread while the previous batch is still being written
+    to the collection on a background thread. Written chunks are also added to every index in
+    lexical_indexes, and on_write is called after every write, if given. With shard_for, a callable
+    mapping a source to its sub-collection, chunks are also written to their source's shard.
+    """
+
+    def __init__(self, collection, embedding_function, batch_size: int = 512, lexical_indexes=(),
+                 on_write=None, shard_for=None):
+        self.collection = collection
+        self.embedding_function = embedding_function
+        self.batch_size = batch_size
+        self.lexical_indexes = lexical_indexes
+        self.on_write = on_write
+        self.shard_for = shard_for
+        self._ids, self._texts, self._metadatas = [], [], []
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    def add(self, ids, texts, metadatas):
+        """Queue chunks, embedding and writing every full batch"""
+        self._ids.extend(ids)
+        self._texts.extend(texts)
+        self._metadatas.extend(metadatas)
+        while len(self._texts) >= self.batch_size:
+            self._flush(self.batch_size)
+
+    def close(self):
+        """Write the remaining chunks and wait for all writes to finish"""
+        try:
+            if self._texts:
+                self._flush(len(self._texts))
+            self._wait()
+        finally:
+            self._executor.shutdown()
+
+    def _flush(self, size: int):
+        ids, texts, metadatas = self._ids[:size], self._texts[:size], self._metadatas[:size]
+        del self._ids[:size], self._texts[:size], self._metadatas[:size]
+
+        embeddings = self.embedding_function(texts)
+        # Surface errors from the previous write before queueing the next one
+        self._wait()
+        self._pending = self._executor.submit(self._write, ids, texts, metadatas, embeddings)
+
+    def _write(self, ids, texts, metadatas, embeddings):
+        self.collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+        if self.shard_for is not None:
+            by_source = {}
+            for i, metadata in enumerate(metadatas):
+                by_source.setdefault(metadata["source"], []).append(i)
+            for source, rows in by_source.items():
+                self.shard_for(source).upsert(
+                    ids=[ids[i] for i in rows],
+                    documents=[texts[i] for i in rows],
+                    metadatas=[metadatas[i] for i in rows],
+                    embeddings=[embeddings[i] for i in rows],
+                )
+        for index in self.lexical_indexes:
+            index.add(ids, texts)
+        if self.on_write is not None:
+            self.on_write()
+
+    def _wait(self):
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown()
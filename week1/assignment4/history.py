@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from doc_processor import count_tokens
+
+# Token budget for the formatted history included in prompts
+HISTORY_TOKEN_BUDGET = 1000
+# Token budget for the running summary of older turns
+SUMMARY_TOKEN_BUDGET = 250
+
+def format_message(role: str, content: str):
+    role = "Human" if role == "user" else "Assistant"
+    return f"{role}: {content}"
+
+def truncate_tokens(text: str, max_tokens: int):
+    """Keep roughly the last max_tokens tokens of a text"""
+    words = text.split()
+    return " ".join(words[-max_tokens:]) if count_tokens(text) > max_tokens else text
+
+class _SessionHistory:
+    def __init__(self):
+        self.tail = deque()  # (formatted line, tokens)
+        self.tokens = 0
+        self.summary = ""
+        self.pending = []  # folded lines waiting to be summarized, still shown until they are
+        self.summarizing = False
+        self.formatted = None
+        self.model = ""
+        self.last_used = time.monotonic()
+
+class HistoryManager:
+    """Keeps a token-bounded prompt view of each conversation, updated incrementally as messages arrive.
+
+    Recent turns are kept verbatim while they fit token_budget (and max_messages); older turns are folded
+    into a running summary by a background worker, so formatting a prompt never waits on the LLM. Until
+    the worker has absorbed them, folded turns are still shown, cut to summary_budget tokens. The
+    formatted string is cached and only rebuilt after a change.
+
+    At most max_sessions sessions are held, least recently used first out, and sessions idle for longer
+    than ttl seconds are dropped; a dropped session is rebuilt from load_history on its next use.
+    """
+
+    def __init__(self, summarize, token_budget: int = HISTORY_TOKEN_BUDGET,
+                 summary_budget: int = SUMMARY_TOKEN_BUDGET, load_history=None,
+                 max_sessions: int = 256, ttl: float = None):
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.load_history = load_history
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+
+    def append(self, session_id: str, role: str, content: str):
+        """Record a new message and fold older turns if the tail is over budget"""
+        with self._lock:
+            state = self._state(session_id)
+            self._push(state, format_message(role, content))
+            self._fold(session_id, state, None)
+
+    def format(self, session_id: str, max_messages: int = None, model: str = None):
+        """Return the prompt history: running summary plus the verbatim recent turns.
+
+        model is passed on to the summarizer for this session's older turns.
+        """
+        with self._lock:
+            state = self._state(session_id)
+            if model is not None:
+                state.model = model
+            if max_messages is not None and len(state.tail) > max_messages:
+                self._fold(session_id, state, max_messages)
+            if state.formatted is None:
+                parts = [f"Summary of earlier conversation: {state.summary}"] if state.summary else []
+                parts.extend(self._pending_lines(state))
+                parts.extend(line for line, _ in state.tail)
+                state.formatted = "\n\n".join(parts).strip()
+            return state.formatted
+
+    def forget(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _state(self, session_id: str):
+        now = time.monotonic()
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = self._sessions[session_id] = _SessionHistory()
+            # Rebuild the recent tail from the session store, e.g. after a restart or eviction
+            if self.load_history is not None:
+                for message in self.load_history(session_id):
+                    self._push(state, format_message(message["role"], message["content"]))
+                self._fold(session_id, state, None)
+        state.last_used = now
+        self._sessions.move_to_end(session_id)
+        self._evict(now)
+        return state
+
+    def _evict(self, now: float):
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        if self.ttl is not None:
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if now - oldest.last_used <= self.ttl:
+                    break
+                self._sessions.popitem(last=False)
+
+    def _push(self, state, line: str):
+        tokens = count_tokens(line)
+        state.tail.append((line, tokens))
+        state.tokens += tokens
+        state.formatted = None
+
+    def _fold(self, session_id: str, state, max_messages: int):
+        summary_tokens = count_tokens(state.summary)
+        while state.tail and (state.tokens + summary_tokens > self.token_budget
+                              or (max_messages is not None and len(state.tail) > max_messages)):
+            line, tokens = state.tail.popleft()
+            state.tokens -= tokens
+            state.pending.append(line)
+            state.formatted = None
+        if state.pending and not state.summarizing:
+            state.summarizing = True
+            self._executor.submit(self._summarize, state)
+
+    def _pending_lines(self, state):
+        """The most recent folded lines that fit summary_budget, oldest first"""
+        lines = []
+        budget = self.summary_budget
+        for line in reversed(state.pending):
+            tokens = count_tokens(line)
+            if tokens > budget:
+                if budget > 0:
+                    lines.append(truncate_tokens(line, budget))
+                break
+            lines.append(line)
+            budget -= tokens
+        return lines[::-1]
+
+    def _summarize(self, state):
+        while True:
+            with self._lock:
+                folded = list(state.pending)
+                previous = state.summary
+                if not folded:
+                    state.summarizing = False
+                    return
+            try:
+                summary = self.summarize(previous, "\n\n".join(folded), state.model)
+            except Exception as e:
+                print(f"Error summarizing history: {e}")
+                summary = f"{previous} {' '.join(folded)}".strip()
+            with self._lock:
+                # Lines folded meanwhile stay pending for the next round
+                del state.pending[:len(folded)]
+                state.summary = truncate_tokens(summary, self.summary_budget)
+                state.formatted = None
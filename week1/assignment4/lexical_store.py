@@ -0,0 +1,85 @@
+import sqlite3
+import threading
+import numpy as np
+
+# Stored next to chroma_db and kept in step with it at ingest time
+LEXICAL_STORE_PATH = "lexical_features.sqlite"
+
+def keyword_terms(text: str):
+    """Tokenize like keyword_overlap_score: lowercase, split on whitespace"""
+    return set(text.lower().split())
+
+class LexicalStore:
+    """Sidecar store of per-chunk token-id sets, precomputed at ingest time for keyword re-ranking.
+
+    Every chunk is stored as a sorted int32 array of ids from a vocabulary shared across the
+    collection, so query-time overlap is a vectorized membership test instead of re-tokenizing text.
+    """
+
+    def __init__(self, path: str = LEXICAL_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS vocabulary (term TEXT PRIMARY KEY, id INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS features (chunk_id TEXT PRIMARY KEY, token_ids BLOB NOT NULL)")
+        self.vocabulary = dict(self._conn.execute("SELECT term, id FROM vocabulary"))
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM features").fetchone()[0]
+
+    def _encode(self, text: str, new_terms: list):
+        token_ids = []
+        for term in keyword_terms(text):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                term_id = self.vocabulary[term] = len(self.vocabulary)
+                new_terms.append((term, term_id))
+            token_ids.append(term_id)
+        return np.array(sorted(token_ids), dtype=np.int32)
+
+    def add(self, ids, texts):
+        """Store the token-id sets of chunks, replacing previous entries under the same ids"""
+        with self._lock:
+            new_terms = []
+            rows = [(chunk_id, self._encode(text, new_terms).tobytes()) for chunk_id, text in zip(ids, texts)]
+            self._conn.executemany("INSERT INTO vocabulary (term, id) VALUES (?, ?)", new_terms)
+            self._conn.executemany("INSERT OR REPLACE INTO features (chunk_id, token_ids) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def remove(self, ids):
+        """Drop the features of chunks"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM features WHERE chunk_id = ?", [(chunk_id,) for chunk_id in ids])
+            self._conn.commit()
+
+    def get(self, ids):
+        """Return the token-id arrays of chunks, with None for chunks that have no stored features"""
+        found = {}
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT chunk_id, token_ids FROM features WHERE chunk_id IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+                found.update((chunk_id, np.frombuffer(blob, dtype=np.int32)) for chunk_id, blob in rows)
+        return [found.get(chunk_id) for chunk_id in ids]
+
+    def overlap_counts(self, ids, docs, query: str):
+        """Count the distinct query terms in each chunk, as keyword_overlap_score does, in one vectorized pass"""
+        query_ids = np.array([self.vocabulary[term] for term in keyword_terms(query) if term in self.vocabulary],
+                             dtype=np.int32)
+        arrays = self.get(list(ids))
+        # Chunks written before the store existed fall back to tokenizing their text
+        arrays = [array if array is not None else
+                  np.array(sorted(self.vocabulary[t] for t in keyword_terms(doc) if t in self.vocabulary),
+                           dtype=np.int32)
+                  for array, doc in zip(arrays, docs)]
+        if not arrays or not len(query_ids):
+            return np.zeros(len(arrays))
+
+        lengths = np.fromiter((len(array) for array in arrays), dtype=np.intp, count=len(arrays))
+        flat = np.concatenate(arrays)
+        owners = np.repeat(np.arange(len(arrays)), lengths)
+        return np.bincount(owners, weights=np.isin(flat, query_ids), minlength=len(arrays))
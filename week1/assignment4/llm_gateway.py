@@ -0,0 +1,213 @@
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_MODEL = "deepseek-r1:7b"
+AZURE_ENDPOINT = "https://azure-openai-101.openai.azure.com/"
+AZURE_API_VERSION = "2024-12-01-preview"
+AZURE_DEPLOYMENT = "gpt-4.1"
+AZURE_API_KEY = os.environ.get("AZURE_OPENAI_API_KEY", "api key")
+# Seconds to open a connection, and to wait for a response (or the next chunk of a stream)
+CONNECT_TIMEOUT = 5.0
+REQUEST_TIMEOUT = 120.0
+# Idle keep-alive connections kept per backend
+POOL_SIZE = 8
+
+class _Metrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.connections = 0
+        self.seconds = 0.0
+        self.streams = 0
+        self.first_token_seconds = 0.0
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "connections": self.connections,
+            "reuse_rate": 1 - self.connections / self.requests if self.requests else 0.0,
+            "avg_seconds": self.seconds / self.requests if self.requests else 0.0,
+            "avg_first_token_seconds": self.first_token_seconds / self.streams if self.streams else 0.0,
+        }
+
+class LLMGateway:
+    """Long-lived, connection-pooled clients for Ollama and Azure OpenAI.
+
+    Both clients keep connections alive between calls, so only the first request to each backend pays
+    for the TCP/TLS handshake. Every call has a timeout, and stats() reports how many requests reused
+    an already open connection.
+    """
+
+    def __init__(self, ollama_host: str = OLLAMA_HOST, timeout: float = REQUEST_TIMEOUT,
+                 connect_timeout: float = CONNECT_TIMEOUT, pool_size: int = POOL_SIZE):
+        self.ollama_host = ollama_host.rstrip("/")
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self.metrics = {"ollama": _Metrics(), "azure": _Metrics()}
+        self._ollama = None
+        self._azure = None
+        self._azure_streams = set()
+        self._lock = threading.Lock()
+
+    @property
+    def ollama_session(self):
+        with self._lock:
+            if self._ollama is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._ollama_adapter = adapter
+                self._ollama = session
+            return self._ollama
+
+    @property
+    def azure_client(self):
+        with self._lock:
+            if self._azure is None:
+                import httpx
+                from openai import AzureOpenAI
+                http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                    timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                    event_hooks={"response": [self._track_azure_connection]},
+                )
+                self._azure = AzureOpenAI(
+                    api_version=AZURE_API_VERSION,
+                    azure_endpoint=AZURE_ENDPOINT,
+                    api_key=AZURE_API_KEY,
+                    http_client=http_client,
+                )
+            return self._azure
+
+    def ollama_generate(self, prompt: str, model: str = OLLAMA_MODEL, timeout: float = None, **options) -> str:
+        """Complete a prompt with Ollama's /api/generate"""
+        payload = {"model": model, "prompt": prompt, "stream": False}
+        if options:
+            payload["options"] = options
+        return self._ollama_post("/api/generate", payload, timeout)["response"]
+
+    def ollama_chat(self, messages, model: str = OLLAMA_MODEL, timeout: float = None, **options) -> str:
+        """Answer a chat with Ollama's /api/chat"""
+        payload = {"model": model, "messages": messages, "stream": False}
+        if options:
+            payload["options"] = options
+        return self._ollama_post("/api/chat", payload, timeout)["message"]["content"]
+
+    def azure_chat(self, messages, deployment: str = AZURE_DEPLOYMENT, timeout: float = None, **params) -> str:
+        """Answer a chat with an Azure OpenAI deployment"""
+        client = self.azure_client
+        metrics = self.metrics["azure"]
+        start = time.perf_counter()
+        try:
+            response = client.chat.completions.create(model=deployment, messages=messages,
+                                                      timeout=timeout or self.timeout, **params)
+        except Exception:
+            metrics.errors += 1
+            raise
+        finally:
+            metrics.requests += 1
+            metrics.seconds += time.perf_counter() - start
+        return response.choices[0].message.content
+
+    def ollama_generate_stream(self, prompt: str, model: str = OLLAMA_MODEL, timeout: float = None, **options):
+        """Yield the completion of a prompt from Ollama's /api/generate as tokens arrive"""
+        payload = {"model": model, "prompt": prompt, "stream": True}
+        if options:
+            payload["options"] = options
+        session = self.ollama_session
+        metrics = self.metrics["ollama"]
+        start = time.perf_counter()
+        first_token = True
+        try:
+            with session.post(self.ollama_host + "/api/generate", json=payload, stream=True,
+                              timeout=(self.connect_timeout, timeout or self.timeout)) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("response"):
+                        if first_token:
+                            metrics.streams += 1
+                            metrics.first_token_seconds += time.perf_counter() - start
+                            first_token = False
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        break
+        except Exception:
+            metrics.errors += 1
+            raise
+        finally:
+            metrics.requests += 1
+            metrics.seconds += time.perf_counter() - start
+            pools = self._ollama_adapter.poolmanager.pools
+            metrics.connections = sum(pools[key].num_connections for key in pools.keys())
+
+    def azure_chat_stream(self, messages, deployment: str = AZURE_DEPLOYMENT, timeout: float = None, **params):
+        """Yield the answer of an Azure OpenAI deployment as tokens arrive"""
+        client = self.azure_client
+        metrics = self.metrics["azure"]
+        start = time.perf_counter()
+        first_token = True
+        try:
+            stream = client.chat.completions.create(model=deployment, messages=messages, stream=True,
+                                                    timeout=timeout or self.timeout, **params)
+            with stream:
+                for chunk in stream:
+                    # Content filter results arrive in chunks without choices
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    if first_token:
+                        metrics.streams += 1
+                        metrics.first_token_seconds += time.perf_counter() - start
+                        first_token = False
+                    yield chunk.choices[0].delta.content
+        except Exception:
+            metrics.errors += 1
+            raise
+        finally:
+            metrics.requests += 1
+            metrics.seconds += time.perf_counter() - start
+
+    def stats(self):
+        """Per-backend request counts, errors, new connections and reuse rate"""
+        return {backend: metrics.stats() for backend, metrics in self.metrics.items()}
+
+    def _ollama_post(self, path: str, payload: dict, timeout: float = None):
+        session = self.ollama_session
+        metrics = self.metrics["ollama"]
+        start = time.perf_counter()
+        try:
+            response = session.post(self.ollama_host + path, json=payload,
+                                    timeout=(self.connect_timeout, timeout or self.timeout))
+            response.raise_for_status()
+            return response.json()
+        except Exception:
+            metrics.errors += 1
+            raise
+        finally:
+            metrics.requests += 1
+            metrics.seconds += time.perf_counter() - start
+            pools = self._ollama_adapter.poolmanager.pools
+            metrics.connections = sum(pools[key].num_connections for key in pools.keys())
+
+    def _track_azure_connection(self, response):
+        # Each new TCP connection shows up as a new network stream
+        stream = response.extensions.get("network_stream")
+        if stream is not None and id(stream) not in self._azure_streams:
+            self._azure_streams.add(id(stream))
+            self.metrics["azure"].connections += 1
+
+@lru_cache(maxsize=None)
+def get_gateway():
+    """Return the process-wide LLM gateway"""
+    return LLMGateway()
@@ -1,50 +1,82 @@
-from chroma_utils import collection
+import os
+from chroma_utils import get_engine,multi_process_embeddings,sync_documents
 from session import create_session
-from chatbot import conversational_rag_query
-from chroma_utils import process_and_add_documents
-# Create a new conversation session
-session_id = create_session()
-source_file='Source'
-process_and_add_documents(collection,source_file)
-model=''
-print("Enter the model you want to use. Choose an option:\n1. Ollama\n2. GPT-4o")
-option=input()
-while True:
-    try:
-        if int(option)==1:
-            model='ollama'
-            break
-        elif int(option)==2:
-            model='gpt'
-            break
-        else:
+from chatbot import answer_cache,conversational_rag_query
+from llm_gateway import get_gateway
+from watcher import DocumentWatcher
+
+
+def main():
+    # Create a new conversation session
+    session_id = create_session()
+    source_file='Source'
+    engine = get_engine()
+    # Load Chroma and the embedding model while the user picks an LLM
+    engine.warm_up(background=True)
+    model=''
+    print("Enter the model you want to use. Choose an option:\n1. Ollama\n2. GPT-4o")
+    option=input()
+    while True:
+        try:
+            if int(option)==1:
+                model='ollama'
+                break
+            elif int(option)==2:
+                model='gpt'
+                break
+            else:
+                print("enter valid input")
+                option=input()
+        except Exception as e:
             print("enter valid input")
             option=input()
-    except Exception as e:
-        print("enter valid input")
-        option=input()
-
-
-while True:
-    print("enter your question or enter exit to end the session:")
-    query=input("chat: ")
-    if query.lower().strip()=='exit':
-        break
-    response, sources = conversational_rag_query(
-                    collection,
-                    query,
-                    session_id,
-                    model=model
-        )
-
-    # query = "When was GreenGrow Innovations founded?"
-
-    # print(response)
-    # # query = "Where is it located?"
-    # response, sources = conversational_rag_query(
-    #             collection,
-    #             query,
-    #             session_id
-    # )
-
-    print(response)
+
+    collection = engine.collection
+    # Parsing runs in worker processes, so this module must be import-safe
+    # Only new or changed files are re-ingested; see ingest_manifest.json
+    with multi_process_embeddings():
+        sync_documents(collection,source_file,workers=os.cpu_count() or 1)
+    print("Embedding cache:", engine.embedding_function.stats())
+    # Keep the index in step with Source while the chat is running
+    watcher = DocumentWatcher(collection, source_file).start()
+
+    while True:
+        print("enter your question or enter exit to end the session:")
+        query=input("chat: ")
+        if query.lower().strip()=='exit':
+            break
+        timings = {}
+        response, sources = conversational_rag_query(
+                        collection,
+                        query,
+                        session_id,
+                        model=model,
+                        stream=True,
+                        timings=timings
+            )
+
+        # query = "When was GreenGrow Innovations founded?"
+
+        # print(response)
+        # # query = "Where is it located?"
+        # response, sources = conversational_rag_query(
+        #             collection,
+        #             query,
+        #             session_id
+        # )
+
+        # Print tokens as they arrive; the turn is saved to the history when the stream ends
+        for token in response:
+            print(token, end="", flush=True)
+        print()
+        print("Timings:", {stage: round(value, 3) if isinstance(value, float) else value
+                         for stage, value in timings.items()})
+
+    watcher.stop()
+    print("Retrieval cache:", engine.query_cache.stats())
+    print("LLM connections:", get_gateway().stats())
+    print("Answer cache:", answer_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
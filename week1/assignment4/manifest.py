@@ -0,0 +1,39 @@
+import hashlib
+import json
+import os
+
+# Stored next to chroma_db so the two are moved and deleted together
+MANIFEST_PATH = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+
+def file_hash(file_path: str, block_size: int = 1024 * 1024):
+    """Compute the SHA-256 of a file without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(path: str = MANIFEST_PATH):
+    """Load the ingest manifest, or an empty one if it is missing or from another version"""
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"version": MANIFEST_VERSION, "files": {}}
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "files": {}}
+    return manifest
+
+def manifest_fingerprint(manifest):
+    """Hash the indexed files' content hashes and chunk ids, identifying what the collection holds"""
+    files = {path: [entry["hash"], entry["chunk_ids"]] for path, entry in manifest["files"].items()}
+    return hashlib.sha256(json.dumps(files, sort_keys=True).encode("utf-8")).hexdigest()
+
+def save_manifest(manifest, path: str = MANIFEST_PATH):
+    """Atomically write the ingest manifest"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
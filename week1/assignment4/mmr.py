@@ -0,0 +1,35 @@
+import numpy as np
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def mmr_select(query_embedding, candidate_embeddings, k: int, lambda_mult: float = 0.5):
+    """Return the indices of k candidates chosen by maximal marginal relevance.
+
+    Each step picks the candidate maximizing
+    lambda_mult * sim(query, c) - (1 - lambda_mult) * max(sim(c, selected)), with cosine similarity.
+    All similarities come from two matrix products; only the k selection steps loop in Python.
+    """
+    candidates = _normalize(candidate_embeddings)
+    n = len(candidates)
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    relevance = candidates @ _normalize(query_embedding)
+    similarity = candidates @ candidates.T
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected = []
+    for _ in range(k):
+        # Nothing is selected yet on the first step, so redundancy does not apply
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * penalty, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
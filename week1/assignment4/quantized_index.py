@@ -0,0 +1,132 @@
+import json
+import os
+import numpy as np
+
+# Files are stored next to chroma_db under this prefix
+QUANTIZED_INDEX_PATH = "quantized_index"
+
+class QuantizedIndex:
+    """int8-quantized, memory-mapped copy of the chunk embeddings for a cheap first-pass search.
+
+    Each vector is stored as int8 with its own scale, plus its squared norm, so squared L2 distances
+    (Chroma's default space) can be approximated with one int8 scan. The best candidates are then
+    re-scored exactly against the float32 vectors, which stay in a separate memory-mapped file and
+    are only paged in for those candidates.
+    """
+
+    def __init__(self, path: str = QUANTIZED_INDEX_PATH):
+        self.path = path
+        with open(path + ".ids.json", 'r', encoding='utf-8') as file:
+            self.ids = json.load(file)
+        meta = np.load(path + ".meta.npz")
+        self.scales = meta["scales"]
+        self.norms = meta["norms"]
+        # Identifies the collection contents the index was built from
+        self.fingerprint = str(meta["fingerprint"]) if "fingerprint" in meta else ""
+        shape = (len(self.ids), int(meta["dim"]))
+        if not self.ids:
+            # Empty files cannot be memory-mapped
+            self.codes = np.zeros(shape, dtype=np.int8)
+            self.vectors = np.zeros(shape, dtype=np.float32)
+            return
+        self.codes = np.memmap(path + ".int8", dtype=np.int8, mode="r", shape=shape)
+        self.vectors = np.memmap(path + ".f32", dtype=np.float32, mode="r", shape=shape)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, collection, path: str = QUANTIZED_INDEX_PATH, page_size: int = 5000, fingerprint: str = ""):
+        """Write the index from every embedding stored in the collection and open it"""
+        count = collection.count()
+        ids = []
+        codes = vectors = None
+        scales = np.zeros(count, dtype=np.float32)
+        norms = np.zeros(count, dtype=np.float32)
+        row = 0
+        for offset in range(0, count, page_size):
+            page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+            block = np.asarray(page["embeddings"], dtype=np.float32)
+            if codes is None:
+                shape = (count, block.shape[1])
+                codes = np.memmap(path + ".int8.tmp", dtype=np.int8, mode="w+", shape=shape)
+                vectors = np.memmap(path + ".f32.tmp", dtype=np.float32, mode="w+", shape=shape)
+            rows = slice(row, row + len(block))
+            block_scales = np.abs(block).max(axis=1) / 127.0
+            block_scales[block_scales == 0] = 1.0
+            codes[rows] = np.round(block / block_scales[:, None]).astype(np.int8)
+            vectors[rows] = block
+            scales[rows] = block_scales
+            norms[rows] = np.einsum("ij,ij->i", block, block)
+            ids.extend(page["ids"])
+            row += len(block)
+
+        dim = 0
+        if codes is not None:
+            dim = codes.shape[1]
+            codes.flush()
+            vectors.flush()
+            del codes, vectors
+            os.replace(path + ".int8.tmp", path + ".int8")
+            os.replace(path + ".f32.tmp", path + ".f32")
+        else:
+            # Empty collection: empty files keep the layout consistent
+            open(path + ".int8", 'wb').close()
+            open(path + ".f32", 'wb').close()
+        with open(path + ".meta.npz", 'wb') as file:
+            np.savez(file, scales=scales[:row], norms=norms[:row], dim=dim, fingerprint=fingerprint)
+        with open(path + ".ids.json", 'w', encoding='utf-8') as file:
+            json.dump(ids, file)
+        return cls(path)
+
+    @staticmethod
+    def exists(path: str = QUANTIZED_INDEX_PATH):
+        return all(os.path.exists(path + suffix) for suffix in (".int8", ".f32", ".meta.npz", ".ids.json"))
+
+    def search(self, query_embeddings, k: int, candidates: int = None, block_rows: int = 65536):
+        """Return (ids, squared L2 distances) of the exact top k per query, after an int8 first pass"""
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        n = len(self.ids)
+        if not n:
+            return [[] for _ in queries], [[] for _ in queries]
+        candidates = min(n, max(candidates or k * 10, k))
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+
+        # First pass: ||x||^2 - 2 * scale * (code . q), blockwise so only int8 rows are scanned
+        best_rows = np.empty((len(queries), 0), dtype=np.intp)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, n, block_rows):
+            codes = np.asarray(self.codes[start:start + block_rows], dtype=np.float32)
+            approx = self.norms[start:start + len(codes)] - 2 * (queries @ codes.T) * self.scales[start:start + len(codes)]
+            rows = np.broadcast_to(np.arange(start, start + len(codes)), approx.shape)
+            best_scores = np.concatenate([best_scores, approx], axis=1)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            if best_scores.shape[1] > candidates:
+                keep = np.argpartition(best_scores, candidates - 1, axis=1)[:, :candidates]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        # Second pass: exact squared L2 against the full-precision vectors of the candidates only
+        result_ids, result_distances = [], []
+        for q, rows in enumerate(best_rows):
+            rows = np.sort(rows)
+            exact = self.norms[rows] - 2 * (self.vectors[rows] @ queries[q]) + query_norms[q]
+            order = np.argsort(exact, kind="stable")[:k]
+            result_ids.append([self.ids[rows[i]] for i in order])
+            result_distances.append([float(exact[i]) for i in order])
+        return result_ids, result_distances
+
+    def query(self, collection, query_embeddings, n_results: int, include, candidates: int = None):
+        """Answer like collection.query, using the index for the search and Chroma only for documents"""
+        ids, distances = self.search(query_embeddings, n_results, candidates)
+        results = {"ids": ids, "distances": distances}
+        fields = [field for field in include if field in ("documents", "metadatas")]
+        wanted = list({chunk_id for row in ids for chunk_id in row})
+        if not wanted:
+            results.update((field, [[] for _ in ids]) for field in fields)
+        elif fields:
+            fetched = collection.get(ids=wanted, include=fields)
+            by_id = {field: dict(zip(fetched["ids"], fetched[field])) for field in fields}
+            for field in fields:
+                results[field] = [[by_id[field].get(chunk_id) for chunk_id in row] for row in ids]
+        return results
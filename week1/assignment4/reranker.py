@@ -0,0 +1,94 @@
+import hashlib
+import threading
+import time
+from functools import lru_cache
+from query_cache import QueryCache
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Seconds a re-ranking call may spend scoring uncached pairs
+RERANK_LATENCY_BUDGET = 0.3
+# Candidates fetched per final chunk when re-ranking
+RERANK_POOL_FACTOR = 4
+
+class CrossEncoderReranker:
+    """Re-rank (doc, score, meta) search results with a local cross-encoder, scoring all pairs in one CPU batch.
+
+    Pair scores are cached, and the number of uncached pairs scored per call is capped by what the
+    measured per-pair cost allows within latency_budget; candidates beyond the cap keep their original
+    order after the re-ranked ones. At least one pair is always scored, so the cost estimate keeps being
+    measured and the cap recovers after a slow call. The first, cold predict call is not measured.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, latency_budget: float = RERANK_LATENCY_BUDGET,
+                 batch_size: int = 32, cache_entries: int = 100_000):
+        self.model_name = model_name
+        self.latency_budget = latency_budget
+        self.batch_size = batch_size
+        self.pair_cache = QueryCache(max_entries=cache_entries, ttl=float("inf"))
+        self.seconds_per_pair = None
+        self.truncated = 0
+        self._warm = False
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name, device="cpu")
+            return self._model
+
+    def _key(self, query: str, doc: str):
+        return hashlib.sha256(f"{self.model_name}\0{query}\0{doc}".encode("utf-8")).digest()
+
+    def _pair_budget(self):
+        """How many uncached pairs fit in the latency budget, from the cost measured so far"""
+        if self.latency_budget is None or self.seconds_per_pair is None:
+            return None
+        return max(1, int(self.latency_budget / self.seconds_per_pair))
+
+    def rerank(self, query: str, results, top_k: int = None):
+        """Return results re-ordered by cross-encoder score, cut to top_k"""
+        keys = [self._key(query, doc) for doc, _, _ in results]
+        scores = [self.pair_cache.get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        budget = self._pair_budget()
+        if budget is not None and len(missing) > budget:
+            # Score the best-ranked candidates first, leave the rest unscored
+            self.truncated += 1
+            missing = missing[:budget]
+
+        if missing:
+            model = self.model
+            start = time.perf_counter()
+            predicted = model.predict([(query, results[i][0]) for i in missing], batch_size=self.batch_size,
+                                      show_progress_bar=False)
+            cost = (time.perf_counter() - start) / len(missing)
+            if not self._warm:
+                # The first call pays for lazy initialization and says little about steady-state cost
+                self._warm = True
+            elif self.seconds_per_pair is None:
+                self.seconds_per_pair = cost
+            else:
+                self.seconds_per_pair = 0.5 * self.seconds_per_pair + 0.5 * cost
+            for i, score in zip(missing, predicted):
+                scores[i] = float(score)
+                self.pair_cache.put(keys[i], scores[i])
+
+        scored = sorted((i for i, score in enumerate(scores) if score is not None), key=lambda i: -scores[i])
+        unscored = [i for i, score in enumerate(scores) if score is None]
+        ranked = [(results[i][0], scores[i], results[i][2]) for i in scored] + [results[i] for i in unscored]
+        return ranked[:top_k] if top_k is not None else ranked
+
+    def stats(self):
+        """Pair cache hit rate plus how often the latency budget cut the stage short"""
+        stats = self.pair_cache.stats()
+        stats.update(truncated=self.truncated, seconds_per_pair=self.seconds_per_pair)
+        return stats
+
+@lru_cache(maxsize=None)
+def get_reranker(model_name: str = RERANK_MODEL):
+    """Return the process-wide cross-encoder re-ranker, loading the model on first use"""
+    return CrossEncoderReranker(model_name)
@@ -1,50 +1,92 @@
+import hashlib
+import re
 import uuid
-from datetime import datetime
+from functools import lru_cache
 import json
-import ollama
-from openai import AzureOpenAI
-
-
-# In-memory conversation store
-conversations = {}
+from llm_gateway import OLLAMA_MODEL,get_gateway
+from history import HistoryManager
+from query_cache import QueryCache,normalize_query
+from session_store import SessionStore
+
+# Words and phrases that make a question depend on earlier turns
+REFERENTIAL = re.compile(
+    r"\b(it|its|they|them|their|theirs|he|she|him|his|her|hers|what about|the former|the latter|the same)\b"
+)
+# Leading conjunctions and trailing dots that continue the previous turn
+ELLIPSIS = re.compile(r"^\s*(and|or|but|so|what if|why not)\b|\.\.\.|…")
+# Questions this short are usually fragments such as "why?" or "for interns?"
+MIN_STANDALONE_WORDS = 4
+
+rewrite_cache = QueryCache(max_entries=1024, ttl=3600)
+
+@lru_cache(maxsize=None)
+def get_session_store():
+    """Return the process-wide session store, opening the database on first use"""
+    return SessionStore()
+
+@lru_cache(maxsize=None)
+def get_history_manager():
+    """Return the process-wide rolling history, bounded like the session store's hot tier"""
+    store = get_session_store()
+    return HistoryManager(summarize_history, load_history=lambda session_id: get_conversation_history(session_id, 50),
+                          max_sessions=store.hot_sessions, ttl=store.ttl)
 
 def create_session():
     """Create a new conversation session"""
     session_id = str(uuid.uuid4())
-    conversations[session_id] = []
+    get_session_store().create(session_id)
     return session_id
 def add_message(session_id: str, role: str, content: str):
     """Add a message to the conversation history"""
-    if session_id not in conversations:
-        conversations[session_id] = []
-
-    conversations[session_id].append({
-        "role": role,
-        "content": content,
-        "timestamp": datetime.now().isoformat()
-    })
+    # Update the rolling history first: a session it has not seen yet is loaded from the store
+    get_history_manager().append(session_id, role, content)
+    get_session_store().add(session_id, role, content)
 
 def get_conversation_history(session_id: str, max_messages: int = None):
     """Get conversation history for a session"""
-    if session_id not in conversations:
-        return []
-
-    history = conversations[session_id]
-    if max_messages:
-        history = history[-max_messages:]
+    return get_session_store().history(session_id, max_messages)
+def format_history_for_prompt(session_id: str, max_messages: int = 5, model: str = None):
+    """Format conversation history for inclusion in prompts, summarizing turns beyond the token budget"""
+    return get_history_manager().format(session_id, max_messages, model)
+def summarize_history(summary: str, messages: str, model: str = "") -> str:
+    """Fold older conversation turns into the running summary, with the model the user picked"""
+    prompt = f"""
+    Update the summary of a conversation with the new messages below. Keep names, numbers and
+    decisions, drop pleasantries, and answer with the updated summary only, in at most 150 words.
 
-    return history
-def format_history_for_prompt(session_id: str, max_messages: int = 5):
-    """Format conversation history for inclusion in prompts"""
-    history = get_conversation_history(session_id, max_messages)
-    formatted_history = ""
+    Current summary:
+    {summary}
 
-    for msg in history:
-        role = "Human" if msg["role"] == "user" else "Assistant"
-        formatted_history += f"{role}: {msg['content']}\n\n"
+    New messages:
+    {messages}
+    """
+    chat = [{"role": "user", "content": prompt}]
+    if model == "gpt":
+        response = get_gateway().azure_chat(chat, temperature=0.0)
+    else:
+        response = get_gateway().ollama_chat(chat, model=OLLAMA_MODEL, temperature=0.0)
+    return response.strip()
+def needs_contextualization(query: str) -> bool:
+    """Cheap check for questions that refer back to the conversation and need rewriting"""
+    text = query.lower()
+    return (len(text.split()) < MIN_STANDALONE_WORDS or REFERENTIAL.search(text) is not None
+            or ELLIPSIS.search(text) is not None)
 
-    return formatted_history.strip()
 def contextualize_query(query: str, conversation_history: str, model: str) -> str:
+    """Rewrite a follow-up question as a standalone one, skipping the LLM when there is nothing to resolve"""
+    if not conversation_history.strip() or not needs_contextualization(query):
+        return query
+    key = (hashlib.sha1(conversation_history.encode("utf-8")).hexdigest(), normalize_query(query), model)
+    cached = rewrite_cache.get(key)
+    if cached is not None:
+        return cached
+    rewritten = _rewrite_query(query, conversation_history, model)
+    # A failed rewrite hands back the original query object; only cache real rewrites
+    if rewritten is not query:
+        rewrite_cache.put(key, rewritten)
+    return rewritten
+
+def _rewrite_query(query: str, conversation_history: str, model: str) -> str:
     prompt = f"""
     Given a chat history and the latest user question which might reference context
     in the chat history, formulate a standalone question which can be understood
@@ -59,19 +101,7 @@ def contextualize_query(query: str, conversation_history: str, model: str) -> st
 
     try:
         if model=='gpt':
-            endpoint = "https://azure-openai-101.openai.azure.com/"
-            deployment = "gpt-4.1"
-            api_version = "2024-12-01-preview"
-            subscription_key = "api key"
-
-            # Create Azure OpenAI client
-            client = AzureOpenAI(
-                api_version=api_version,
-                azure_endpoint=endpoint,
-                api_key=subscription_key,
-            )
-            response = client.chat.completions.create(
-            model=deployment,
+            response = get_gateway().azure_chat(
             messages=[
                 {
                     "role": "system",
@@ -91,18 +121,15 @@ def contextualize_query(query: str, conversation_history: str, model: str) -> st
 
         else:
 
-            response = ollama.chat(
-                model="deepseek-r1:7b",
-                messages=[
+            response = get_gateway().ollama_chat(
+                [
                     {"role": "user", "content": prompt}
                 ],
-                options={"temperature": 0.0}
+                model=OLLAMA_MODEL,
+                temperature=0.0
             )
 
-        if model == "gpt":
-            return response.choices[0].message.content.strip()
-        else:
-            return response["message"]["content"].strip()
+        return response.strip()
 
     except Exception as e:
         print(f"Error contextualizing query: {e}")
@@ -0,0 +1,145 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+SESSION_DB_PATH = "sessions.sqlite"
+# Sessions idle for longer than this are deleted
+SESSION_TTL = 7 * 24 * 3600
+
+class SessionStore:
+    """Conversation store in SQLite (WAL mode) with an LRU in-memory tier of recently used sessions.
+
+    Messages are keyed by (session_id, seq), so the last N messages of a session are one index range
+    scan whatever its length. The hot tier keeps the last hot_messages messages of at most hot_sessions
+    sessions; writes go through to SQLite, so evicting a session from memory loses nothing.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH, ttl: float = SESSION_TTL, hot_sessions: int = 256,
+                 hot_messages: int = 50, expire_interval: float = 60.0):
+        self.path = path
+        self.ttl = ttl
+        self.hot_sessions = hot_sessions
+        self.hot_messages = hot_messages
+        self.expire_interval = expire_interval
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._hot = OrderedDict()  # session_id -> {"length": int, "tail": deque of recent messages}
+        self._last_expiry = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, length INTEGER NOT NULL, last_active REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_active ON sessions (last_active)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+            "timestamp TEXT NOT NULL, PRIMARY KEY (session_id, seq)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def create(self, session_id: str):
+        """Register an empty session"""
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO sessions (session_id, length, last_active) VALUES (?, 0, ?)",
+                               (session_id, time.time()))
+            self._conn.commit()
+            self._remember(session_id, 0, [])
+        self.expire_idle()
+
+    def add(self, session_id: str, role: str, content: str):
+        """Append a message, creating the session if it does not exist"""
+        message = {"role": role, "content": content, "timestamp": datetime.now().isoformat()}
+        with self._lock:
+            length = self._length(session_id)
+            self._conn.execute(
+                "INSERT INTO messages (session_id, seq, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (session_id, length, role, content, message["timestamp"]),
+            )
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, length, last_active) VALUES (?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET length = excluded.length, last_active = excluded.last_active",
+                (session_id, length + 1, time.time()),
+            )
+            self._conn.commit()
+            entry = self._hot.get(session_id)
+            if entry is not None:
+                entry["length"] += 1
+                entry["tail"].append(message)
+        if time.monotonic() - self._last_expiry > self.expire_interval:
+            self.expire_idle()
+
+    def history(self, session_id: str, max_messages: int = None):
+        """Return the last max_messages messages of a session (all of them if None), oldest first"""
+        with self._lock:
+            entry = self._hot.get(session_id)
+            if entry is not None:
+                self._hot.move_to_end(session_id)
+                tail = entry["tail"]
+                if len(tail) == entry["length"] or (max_messages and max_messages <= len(tail)):
+                    self.hits += 1
+                    messages = list(tail)
+                    return messages[-max_messages:] if max_messages else messages
+            self.misses += 1
+
+            query = "SELECT role, content, timestamp FROM messages WHERE session_id = ? ORDER BY seq DESC"
+            params = (session_id,)
+            if max_messages:
+                query += " LIMIT ?"
+                params += (max_messages,)
+            rows = self._conn.execute(query, params).fetchall()
+            messages = [{"role": role, "content": content, "timestamp": timestamp}
+                        for role, content, timestamp in reversed(rows)]
+            if entry is None:
+                length = self._length(session_id)
+                if length or self._exists(session_id):
+                    self._remember(session_id, length, messages[-self.hot_messages:])
+            return messages
+
+    def expire_idle(self):
+        """Delete sessions that have been idle for longer than the TTL"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._last_expiry = time.monotonic()
+            idle = [row[0] for row in self._conn.execute(
+                "SELECT session_id FROM sessions WHERE last_active < ?", (cutoff,))]
+            for session_id in idle:
+                self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._hot.pop(session_id, None)
+            if idle:
+                self._conn.commit()
+                self.expired += len(idle)
+        return len(idle)
+
+    def stats(self):
+        """Return hot-tier hit rate, occupancy and expiry counters"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "hot_sessions": len(self._hot),
+            "expired": self.expired,
+        }
+
+    def _length(self, session_id: str):
+        entry = self._hot.get(session_id)
+        if entry is not None:
+            return entry["length"]
+        row = self._conn.execute("SELECT length FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _exists(self, session_id: str):
+        return self._conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is not None
+
+    def _remember(self, session_id: str, length: int, messages):
+        self._hot[session_id] = {"length": length, "tail": deque(messages, maxlen=self.hot_messages)}
+        self._hot.move_to_end(session_id)
+        while len(self._hot) > self.hot_sessions:
+            self._hot.popitem(last=False)
@@ -0,0 +1,50 @@
+import threading
+from chroma_utils import snapshot_documents,sync_documents
+from manifest import MANIFEST_PATH
+
+class DocumentWatcher:
+    """Poll a document tree and apply incremental index updates on a background thread.
+
+    Each poll is a recursive stat-only snapshot. A change is applied once the snapshot has been stable
+    for one interval, so files that are still being copied are not ingested half-written. The first stable
+    snapshot is always synced against the manifest, picking up files changed during the startup sync.
+    """
+
+    def __init__(self, collection, folder_path: str, manifest_path: str = MANIFEST_PATH, interval: float = 5.0):
+        self.collection = collection
+        self.folder_path = folder_path
+        self.manifest_path = manifest_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._applied = None
+
+    def start(self):
+        """Start polling in a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="document-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        """Stop polling and wait for an in-progress sync to finish"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def poll(self, previous: dict = None):
+        """Take a snapshot and sync it if it differs from the last applied one and matches previous"""
+        snapshot = snapshot_documents(self.folder_path)
+        if snapshot != self._applied and (previous is None or snapshot == previous):
+            sync_documents(self.collection, self.folder_path, self.manifest_path, snapshot=snapshot)
+            self._applied = snapshot
+        return snapshot
+
+    def _run(self):
+        previous = snapshot_documents(self.folder_path)
+        while not self._stop.wait(self.interval):
+            try:
+                previous = self.poll(previous)
+            except Exception as e:
+                print(f"Error watching {self.folder_path}: {str(e)}")